@@ -0,0 +1,155 @@
+"""
+Batch generation of many islands, for catalogs of islands.
+
+An island is made for each seed and each combination of the values of the grids of the general control :
+    python batch.py --seeds 0-999 --grid max_it=12,24 --grid num_frac=4,8
+makes 4000 islands. They're spread over a pool of processes that each take the next island as soon as they're
+done with one, so a slow island never holds the others back.
+
+Each island gets its own files in the output directory, named after its seed and a hash of the values it changes,
+and a JSON sidecar with its seed, all the values of its general control and the time it took. The sidecar is
+written last, so an island with a sidecar is complete : running the same batch again after an interruption only
+makes the islands that don't have one yet. The sidecar also lists the formats saved, so running it again with
+more formats only adds the missing files.
+
+Seeds starting with a minus sign (like -5,-3 or -10--1) look like options to the command line, so they have to be
+given as --seeds=-10--1.
+
+Usage : python batch.py --seeds 0-99 [--grid NAME=V1,V2...] [--output batch] [--formats png png16 npy normals]
+"""
+
+import argparse
+import contextlib
+import hashlib
+import io
+import itertools
+import json
+import os
+import re
+import time
+from multiprocessing import Pool
+
+import export
+import main
+
+
+"""
+What each format saves, from the generator outputs, to a path without extension.
+"""
+formats = {
+    "png": lambda data, normals, path: main.height_image(data).save(path + ".png", "PNG"),
+    "png16": lambda data, normals, path: export.export_png16(data, path + "_16.png"),
+    "npy": lambda data, normals, path: export.export_npy(data, path + ".npy"),
+    "normals": lambda data, normals, path: main.vectors_image(normals).save(path + "_normals.png", "PNG"),
+}
+
+
+def parse_seeds(texts):
+    """
+    Reads seeds like "7", "-5", "0-99", "-10--1" (both ends included) or "3,5,8" into a list of ints.
+    On the command line, the ones starting with a minus sign need the --seeds=-10--1 form.
+    """
+    seeds = []
+    for text in texts:
+        for part in text.split(","):
+            match = re.fullmatch(r"\s*(-?\d+)\s*-\s*(-?\d+)\s*", part)
+            if match:
+                seeds.extend(range(int(match.group(1)), int(match.group(2)) + 1))
+            else:
+                seeds.append(int(part))
+    return seeds
+
+
+def parse_grid(text):
+    """
+    Reads a grid like "max_it=12,24" into a name and a list of values, of the type of the default.
+    """
+    name, _, values = text.partition("=")
+    return name, [main.parse_control("{0}={1}".format(name, value))[1] for value in values.split(",")]
+
+
+def jobs(seeds, grids):
+    """
+    The islands to make, as (name, seed, control) for each seed and each combination of the values of the grids.
+    """
+    names = [name for name, values in grids]
+    for values in itertools.product(*[values for name, values in grids]):
+        control = dict(zip(names, values))
+        digest = hashlib.sha256(json.dumps(control, sort_keys=True).encode("utf-8")).hexdigest()[:8]
+        for seed in seeds:
+            yield "island_{0}_{1}".format(seed, digest), seed, control
+
+
+def _make_island(task):
+    """
+    Makes an island in a worker, saves it in the formats names and then its sidecar, which also lists the formats
+    saved before (saved). Returns its name and how long it took.
+    """
+    name, seed, control, output, names, saved = task
+    start = time.perf_counter()
+    generator = main.IslandGenerator(seed, **control)
+    path = os.path.join(output, name)
+    with contextlib.redirect_stdout(io.StringIO()):  # the progress of each island would drown the one of the batch
+        data, normals, gradients = generator.generate()
+        for format_name in names:
+            formats[format_name](data, normals, path)
+    elapsed = time.perf_counter() - start
+
+    sidecar = {"seed": seed, "changed": control, "control": generator.get_control(), "seconds": elapsed,
+               "files": saved + names}
+    with open(path + ".json.tmp", "w") as f:
+        json.dump(sidecar, f, indent=2)
+    os.replace(path + ".json.tmp", path + ".json")
+    return name, elapsed
+
+
+def saved_formats(path):
+    """
+    The formats already saved for the island at path (without extension), from its sidecar (none without one).
+    """
+    try:
+        with open(path + ".json") as f:
+            return json.load(f)["files"]
+    except FileNotFoundError:
+        return []
+
+
+def run_batch(seeds, grids=(), output="batch", names=("png",), workers=None):
+    """
+    Makes every island of the batch that isn't already in output, or only saves the formats of names it's missing.
+    Returns the number of islands made and the time.
+    """
+    os.makedirs(output, exist_ok=True)
+    todo = []
+    for name, seed, control in jobs(seeds, list(grids)):
+        saved = saved_formats(os.path.join(output, name))
+        missing = [format_name for format_name in names if format_name not in saved]
+        if missing:
+            todo.append((name, seed, control, output, missing, saved))
+    total = len(list(jobs(seeds, list(grids))))
+    print("{0} islands to make, {1} already done.".format(len(todo), total - len(todo)))
+
+    start = time.perf_counter()
+    done = 0
+    with Pool(workers) as pool:
+        for name, elapsed in pool.imap_unordered(_make_island, todo, chunksize=1):
+            done += 1
+            rate = done / (time.perf_counter() - start)
+            print("{0}/{1} {2} in {3:.2f}s, {4:.2f} islands/s.".format(done, len(todo), name, elapsed, rate))
+    return done, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generates islands for many seeds and values of the general control.")
+    parser.add_argument("--seeds", nargs="+", required=True,
+                        help="seeds, like 7, 0-99 or 3,5,8 (--seeds=-10--1 for the ones starting with a minus sign)")
+    parser.add_argument("--grid", type=parse_grid, action="append", default=[], metavar="NAME=V1,V2...",
+                        help="values to try for a value of the general control, like --grid max_it=12,24")
+    parser.add_argument("--output", default="batch", help="directory of the islands")
+    parser.add_argument("--formats", nargs="+", choices=sorted(formats), default=["png"], help="files to save")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes, one per core by default")
+    args = parser.parse_args()
+
+    done, elapsed = run_batch(parse_seeds(args.seeds), args.grid, args.output, args.formats, args.workers)
+    if done:
+        print("Made {0} islands in {1:.1f}s, {2:.2f} islands/s.".format(done, elapsed, done / elapsed))
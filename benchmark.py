@@ -0,0 +1,438 @@
+"""
+Benchmarks for the island generator.
+
+Usage : python benchmark.py stages [--sizes 256 512 1024 2048] [--output results.json]
+        python benchmark.py warp [--sizes 1024 4096] [--rows 16]
+        python benchmark.py parallel 1 2 4 8 16 [--sizes 512]
+        python benchmark.py julia [--sizes 1024] [--seeds 0 1 2] [--adaptive 4 8 16] [--set max_it=96]
+        python benchmark.py culling [--sizes 512] [--radius-offsets 0 0.2 0.4] [--set normalization=bounded]
+        python benchmark.py vectors [--sizes 1024] [--rows 4]
+        python benchmark.py noise [--samples 1000000] [--octaves 1 8] [--sizes 512]
+        python benchmark.py erosion 1 4 [--sizes 1024] [--iterations 20] [--tile-size 256]
+
+ - stages times each stage of the pipeline on its own (and its peak memory) for each size, first with the default
+   general control, then changing max_it, num_frac and num_warpings one at a time. The results are saved as JSON,
+   along with the commit they come from, to compare them between commits.
+ - warp compares the per-pixel warp with the batched one. The per-pixel one is way too slow to run on a whole
+   4096x4096 image, so both are timed on the same block of rows and the time is extrapolated to the full image.
+ - parallel renders the whole island with parallel.render for each number of workers.
+ - julia computes the julia data of real islands with and without the shortcuts of julia_max (skipping the
+   pixels that can't get any higher, periodicity checking), and prints the time and the counters of each.
+   Then it does it with julia_adaptive for each smallest rectangle, checking it against the full evaluation :
+   it prints the share of pixels filled without being computed and the number of them that got a wrong count.
+ - culling generates the island with and without skipping the ocean (see IslandGenerator.land_spans) for each
+   radius_offset, and prints the share of land and the speedup of each stage.
+ - vectors compares the per-pixel warp with Vector and with Vector2 (time, vectors made and peak memory, on a few
+   rows extrapolated to the full image), and prints the peak memory of the stages working on fields of vectors.
+ - noise times each backend of the simplex noise (see main.noise_backends) on random positions, in samples per
+   second for each number of octaves, then on the warp of a whole island, and checks they all give the same values.
+ - erosion erodes an island with generator.erode, then with parallel.erode for each number of workers, and prints
+   the cost per iteration of each (see erosion.ErosionReport), checking they give the same island.
+"""
+
+import argparse
+import contextlib
+import cProfile
+import io
+import json
+import os
+import platform
+import pstats
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+import export
+import main
+import parallel
+from instruments import Instruments, MemorySink
+from vector import Vector, Vector2
+
+
+def scalar_warp_rows(generator, y_start, y_end, freq, vector=Vector):
+    """
+    The old per-pixel way of computing rows of the warp, with a vector (of the type vector) and a warp call for each pixel.
+    """
+    data_warp = []
+    for y in range(y_start, y_end):
+        for x in range(generator.imgx):
+            simplex = generator.warp(vector(x / generator.imgx, y / generator.imgy), freq=freq)
+            data_warp.append(generator.transform_warp(x, y, simplex))
+    return data_warp
+
+
+def bench_warp(size, rows, freq=main.island_noise_frequency):
+    """
+    Times the scalar and the batched warp on the same rows of a size x size image, and checks they match.
+    """
+    generator = main.IslandGenerator(0, imgx=size, imgy=size)
+    generator.seed_warp()
+
+    # rows through the center of the island, where the falloff is not zero
+    y_start = size // 2 - rows // 2
+    y_end = y_start + rows
+
+    start = time.perf_counter()
+    scalar = scalar_warp_rows(generator, y_start, y_end, freq)
+    scalar_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batched = generator.warp_rows(y_start, y_end, freq=freq)
+    batched_time = time.perf_counter() - start
+
+    error = np.abs(np.array(scalar).reshape(batched.shape) - batched).max()
+    scale = size / rows
+    print("{0}x{0}: scalar {1:.1f}s, batched {2:.1f}s (extrapolated), speedup x{3:.1f}, max error {4:.2e}".format(
+        size, scalar_time * scale, batched_time * scale, scalar_time / batched_time, error))
+
+
+def pipeline_stages(generator, work_dir):
+    """
+    The stages of generator.generate and the image writers, as (name, function) in the order they run.
+    Each function takes the outputs of the stages before it (a dict) and returns its own.
+    """
+    def save_png(image):
+        image.save(io.BytesIO(), "PNG")
+
+    return [
+        ("update_warp", lambda out: main.scale_list(generator.update_warp(freq=generator.island_noise_frequency), 1.0)),
+        ("update_julia", lambda out: main.scale_list(generator.update_julia(out["update_warp"]), 255.0)),
+        ("add_salt", lambda out: generator.add_salt(out["update_julia"])),
+        ("create_normals", lambda out: main.create_normals(out["add_salt"])),
+        ("create_gradient_from_normals", lambda out: main.create_gradient_from_normals(out["create_normals"])),
+        ("draw", lambda out: save_png(main.height_image(out["add_salt"]))),
+        ("draw_from_vectors", lambda out: save_png(main.vectors_image(out["create_normals"]))),
+        ("export_png16", lambda out: export.export_png16(out["add_salt"], os.path.join(work_dir, "island.png"))),
+    ]
+
+
+def run_stages(size, control, memory):
+    """
+    Runs all the stages once on a size x size island with the given changes of the general control.
+    Returns the time of each stage in seconds, or its peak of allocated memory in bytes if memory is True
+    (tracing the memory slows things down, so both aren't measured on the same run).
+    """
+    generator = main.IslandGenerator(0, **dict(control, imgx=size, imgy=size))
+    results = {}
+    outputs = {}
+    with tempfile.TemporaryDirectory() as work_dir:
+        for name, stage in pipeline_stages(generator, work_dir):
+            if memory:
+                tracemalloc.start()
+            start = time.perf_counter()
+            outputs[name] = stage(outputs)
+            elapsed = time.perf_counter() - start
+            if memory:
+                results[name] = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+            else:
+                results[name] = elapsed
+    return results
+
+
+def sweep(max_its, num_fracs, num_warpings):
+    """
+    The changes of the general control to benchmark : none, then each value of each swept one on its own.
+    """
+    yield {}
+    for name, values in (("max_it", max_its), ("num_frac", num_fracs), ("num_warpings", num_warpings)):
+        for value in values:
+            if value != getattr(main, name):
+                yield {name: value}
+
+
+def _commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bench_stages(sizes, controls, memory=True):
+    """
+    Benchmarks every stage for each size and change of the general control. Returns the results as a dict ready
+    to be saved as JSON.
+    """
+    results = []
+    for size in sizes:
+        for control in controls:
+            times = run_stages(size, control, memory=False)
+            peaks = run_stages(size, control, memory=True) if memory else {}
+            for name, seconds in times.items():
+                results.append({"size": size, "control": control, "stage": name, "seconds": seconds,
+                                "peak_bytes": peaks.get(name)})
+                print("{0}x{0} {1}: {2} {3:.3f}s{4}".format(
+                    size, control or "defaults", name, seconds,
+                    ", {0:.1f} MB".format(peaks[name] / 2 ** 20) if name in peaks else ""))
+    return {"commit": _commit(), "date": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": sys.version.split()[0],
+            "numpy": np.__version__, "machine": platform.platform(), "cpus": os.cpu_count(),
+            "control": main.IslandGenerator().get_control(), "results": results}
+
+
+def bench_julia(size, seeds, control, min_sizes=()):
+    """
+    Times the julia data of the islands of the given seeds with each set of shortcuts of julia_max,
+    checks they all give the same data, and prints the work they did.
+    Then does the same with julia_adaptive for each of min_sizes.
+    """
+    kernels = [("plain", False, False), ("skip saturated", True, False), ("skip saturated + periodicity", True, True)]
+    for seed in seeds:
+        generator = main.IslandGenerator(seed, **dict(control, imgx=size, imgy=size))
+        data = main.scale_list(generator.update_warp(freq=generator.island_noise_frequency), 1.0)
+        generator.seed_julia()
+        reference = None
+        for name, skip_saturated, periodicity in kernels:
+            generator.julia_counters = main.JuliaCounters()
+            x = np.arange(size, dtype=np.float64) * 2 / (size - 1) - 1
+            zx, zy = np.meshgrid(x, x)
+            limits = generator.warp_to_julia_grid(np.asarray(data, dtype=np.float64))
+            start = time.perf_counter()
+            color = generator.julia_max(zx, zy, generator.cs, generator.zs_rand, limits, skip_saturated, periodicity)
+            elapsed = time.perf_counter() - start
+            if reference is None:
+                reference = color
+            print("seed {0}, {1}: {2:.3f}s, identical output: {3}".format(
+                seed, name, elapsed, np.array_equal(reference, color)))
+            print("    " + generator.julia_counters.report(generator.max_it))
+
+        for min_size in min_sizes:
+            generator.julia_counters = main.JuliaCounters()
+            start = time.perf_counter()
+            generator.julia_adaptive(zx, zy, generator.cs, generator.zs_rand, limits, min_size)
+            elapsed = time.perf_counter() - start
+            generator.julia_counters = main.JuliaCounters()
+            generator.julia_adaptive(zx, zy, generator.cs, generator.zs_rand, limits, min_size, check=True)
+            print("seed {0}, adaptive down to {1}x{1}: {2:.3f}s".format(seed, min_size, elapsed))
+            print("    " + generator.julia_counters.report(generator.max_it))
+
+
+def bench_culling(size, radius_offsets, control):
+    """
+    Generates a size x size island with and without culling the ocean for each radius_offset, checks both give
+    the same island, and prints the time of the stages culling changes.
+    """
+    names = ["update_warp", "update_julia", "add_salt"]
+    for radius_offset in radius_offsets:
+        times = {}
+        outputs = {}
+        for cull_ocean in (False, True):
+            sink = MemorySink()
+            generator = main.IslandGenerator(0, Instruments(sink), **dict(control, imgx=size, imgy=size,
+                                                                           radius_offset=radius_offset))
+            generator.cull_ocean = cull_ocean
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                outputs[cull_ocean] = generator.generate()
+            times[cull_ocean] = {"total": time.perf_counter() - start}
+            for measure in sink.measures:
+                times[cull_ocean][measure["stage"]] = times[cull_ocean].get(measure["stage"], 0.0) + measure["wall_seconds"]
+            spans = generator.land_spans()
+            land = int(np.sum(spans[:, 1] - spans[:, 0]))
+
+        identical = all(np.array_equal(a, b) for a, b in zip(outputs[False], outputs[True]))
+        print("{0}x{0}, radius_offset {1}: {2:.1%} land, {3:.2f}s -> {4:.2f}s, speedup x{5:.2f}, identical output: {6}".format(
+            size, radius_offset, land / (size * size), times[False]["total"], times[True]["total"],
+            times[False]["total"] / times[True]["total"], identical))
+        print("    " + ", ".join("{0} x{1:.2f}".format(name, times[False][name] / times[True][name]) for name in names))
+
+
+def bench_vectors(size, rows, freq=main.island_noise_frequency):
+    """
+    Runs the per-pixel warp on rows rows of a size x size image with Vector and with Vector2, and prints for each one
+    the time and number of vectors made for the whole image, and the peak memory of the rows.
+    Then prints the peak memory of the stages working on the normals and gradients of a size x size island.
+    """
+    generator = main.IslandGenerator(0, imgx=size, imgy=size)
+    generator.seed_warp()
+    y_start = size // 2 - rows // 2
+    scale = size / rows
+    outputs = []
+    for vector in (Vector, Vector2):
+        profile = cProfile.Profile()
+        profile.runcall(scalar_warp_rows, generator, y_start, y_start + rows, freq, vector)
+        calls = {name: 0 for name in ("__init__", "<genexpr>")}
+        for (filename, line, name), (primitive_calls, total_calls, *_) in pstats.Stats(profile).stats.items():
+            if filename.endswith("vector.py") and name in calls:
+                calls[name] += total_calls
+        made = calls["__init__"]
+        example = vector(0.5, 0.5)
+        size_each = sys.getsizeof(example) + sum(sys.getsizeof(getattr(example, name))
+                                                 for name in ("__dict__", "values") if hasattr(example, name))
+
+        start = time.perf_counter()
+        outputs.append(scalar_warp_rows(generator, y_start, y_start + rows, freq, vector))
+        elapsed = time.perf_counter() - start
+        tracemalloc.start()
+        scalar_warp_rows(generator, y_start, y_start + rows, freq, vector)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print("{0}x{0}, per-pixel warp with {1}: {2:.1f}s, {3:.0f} vectors made ({4:.0f} per pixel, {5} bytes each) "
+              "and {6:.0f} generators, peak {7:.2f} MB for {8} rows".format(
+                  size, vector.__name__, elapsed * scale, made * scale, made / (rows * size), size_each,
+                  calls["<genexpr>"] * scale, peak / 2 ** 20, rows))
+    print("    identical output: {0}".format(outputs[0] == outputs[1]))
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        data, normals, gradients = main.IslandGenerator(0, imgx=size, imgy=size).generate()
+    stages = [("create_normals", lambda: main.create_normals(data)),
+              ("create_gradient_from_normals", lambda: main.create_gradient_from_normals(normals)),
+              ("vectors_image", lambda: main.vectors_image(normals))]
+    for name, stage in stages:
+        tracemalloc.start()
+        with contextlib.redirect_stdout(io.StringIO()):
+            stage()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print("{0}x{0}, {1}: peak {2:.1f} MB".format(size, name, peak / 2 ** 20))
+
+
+def bench_noise(samples, octaves_list, sizes):
+    """
+    Times fbm_grid with each backend of main.noise_backends on samples random positions for each number of octaves,
+    then update_warp of a size x size island for each size, and checks the backends give the same values.
+    """
+    generator = main.IslandGenerator(0)
+    positions = np.random.RandomState(0).uniform(-1.0, 1.0, (2, samples)) + generator.random.uniform(-10000, 10000)
+    for octaves in octaves_list:
+        outputs = []
+        for backend in sorted(main.noise_backends):
+            generator.noise_backend = backend
+            start = time.perf_counter()
+            outputs.append(generator.fbm_grid(positions[0], positions[1], octaves))
+            elapsed = time.perf_counter() - start
+            print("{0} samples, {1} octaves, {2} backend: {3:.2f}s, {4:.2f} M samples/s".format(
+                samples, octaves, backend, elapsed, samples / elapsed / 1e6))
+        print("    identical output: {0}".format(all(np.array_equal(outputs[0], output) for output in outputs)))
+
+    for size in sizes:
+        outputs = []
+        for backend in sorted(main.noise_backends):
+            generator = main.IslandGenerator(0, imgx=size, imgy=size, noise_backend=backend)
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                outputs.append(generator.update_warp(freq=generator.island_noise_frequency))
+            print("{0}x{0}, update_warp with the {1} backend: {2:.2f}s".format(size, backend, time.perf_counter() - start))
+        print("    identical output: {0}".format(all(np.array_equal(outputs[0], output) for output in outputs)))
+
+
+def bench_erosion(size, iterations, workers_list, tile_size):
+    """
+    Erodes a size x size island for iterations iterations with generator.erode, then with parallel.erode for each
+    number of workers, prints the cost of their iterations and checks they give the same island.
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        data, normals, gradients = main.IslandGenerator(0, imgx=size, imgy=size).generate()
+    generator = main.IslandGenerator(0, imgx=size, imgy=size, erosion_iterations=iterations)
+    with contextlib.redirect_stdout(io.StringIO()):
+        reference = generator.erode(data, gradients)
+    print("{0}x{0}, serial: {1}".format(size, generator.erosion_report.report()))
+    for workers in workers_list:
+        with contextlib.redirect_stdout(io.StringIO()):
+            eroded = parallel.erode(generator, data, gradients, workers, tile_size)
+        identical = all(np.array_equal(a, b) for a, b in zip(reference, eroded))
+        print("{0}x{0}, {1} workers, tiles of {2}: {3}, identical output: {4}".format(
+            size, workers, tile_size, generator.erosion_report.report(), identical))
+
+
+def bench_parallel(size, workers_list):
+    """
+    Times parallel.render on a size x size image for each number of workers, and checks the output never changes.
+    """
+    reference = None
+    base_time = None
+    for workers in workers_list:
+        generator = main.IslandGenerator(0, imgx=size, imgy=size)
+        start = time.perf_counter()
+        data, normals, gradients = parallel.render(generator, workers)
+        elapsed = time.perf_counter() - start
+
+        if reference is None:
+            reference, base_time = (data, normals), elapsed
+        identical = np.array_equal(reference[0], data) and np.array_equal(reference[1], normals)
+        print("{0}x{0}, {1} workers: {2:.1f}s, speedup x{3:.2f}, identical output: {4}".format(
+            size, workers, elapsed, base_time / elapsed, identical))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks for the island generator.")
+    commands = parser.add_subparsers(dest="command")
+
+    stages = commands.add_parser("stages", help="time each stage of the pipeline")
+    stages.add_argument("--sizes", type=int, nargs="+", default=[256, 512, 1024, 2048], help="image sizes")
+    stages.add_argument("--max-it", type=int, nargs="+", default=[12, 48], help="values of max_it to try")
+    stages.add_argument("--num-frac", type=int, nargs="+", default=[4, 16], help="values of num_frac to try")
+    stages.add_argument("--num-warpings", type=int, nargs="+", default=[1, 3], help="values of num_warpings to try")
+    stages.add_argument("--no-memory", action="store_true", help="don't measure the peak memory")
+    stages.add_argument("--output", default="benchmark.json", help="where to save the results")
+
+    warp = commands.add_parser("warp", help="compare the per-pixel warp with the batched one")
+    warp.add_argument("--sizes", type=int, nargs="+", default=[1024, 4096], help="image sizes")
+    warp.add_argument("--rows", type=int, default=16, help="number of rows actually computed for each size")
+
+    julia = commands.add_parser("julia", help="compare the shortcuts of the julia kernel on real islands")
+    julia.add_argument("--sizes", type=int, nargs="+", default=[1024], help="image sizes")
+    julia.add_argument("--seeds", type=int, nargs="+", default=[0, 1, 2], help="seeds of the islands")
+    julia.add_argument("--adaptive", type=int, nargs="*", default=[4, 8, 16],
+                       help="smallest rectangles of julia_adaptive to try")
+    julia.add_argument("--set", type=main.parse_control, action="append", default=[], metavar="NAME=VALUE",
+                       help="changes a value of the general control, like --set max_it=96")
+
+    culling = commands.add_parser("culling", help="compare the island with and without culling the ocean")
+    culling.add_argument("--sizes", type=int, nargs="+", default=[512], help="image sizes")
+    culling.add_argument("--radius-offsets", type=float, nargs="+", default=[-0.2, 0.0, 0.2, 0.4, 0.6],
+                         help="values of radius_offset to try")
+    culling.add_argument("--set", type=main.parse_control, action="append", default=[], metavar="NAME=VALUE",
+                         help="changes a value of the general control, like --set normalization=bounded")
+
+    vectors = commands.add_parser("vectors", help="compare the vector types in the per-pixel warp and the fields")
+    vectors.add_argument("--sizes", type=int, nargs="+", default=[1024], help="image sizes")
+    vectors.add_argument("--rows", type=int, default=4, help="number of rows of the per-pixel warp actually computed")
+
+    noise = commands.add_parser("noise", help="compare the backends of the simplex noise")
+    noise.add_argument("--samples", type=int, default=1000000, help="number of random positions timed")
+    noise.add_argument("--octaves", type=int, nargs="+", default=[1, 8], help="numbers of octaves to try")
+    noise.add_argument("--sizes", type=int, nargs="+", default=[512], help="sizes of the islands whose warp is timed")
+
+    eroding = commands.add_parser("erosion", help="compare the serial erosion with the tiled one")
+    eroding.add_argument("workers", type=int, nargs="+", help="numbers of workers of the tiled erosion")
+    eroding.add_argument("--sizes", type=int, nargs="+", default=[1024], help="image sizes")
+    eroding.add_argument("--iterations", type=int, default=20, help="number of iterations of the erosion")
+    eroding.add_argument("--tile-size", type=int, default=256, help="width and height of the tiles")
+
+    scaling = commands.add_parser("parallel", help="render the island with different numbers of workers")
+    scaling.add_argument("workers", type=int, nargs="+", help="numbers of workers to render the whole island with")
+    scaling.add_argument("--sizes", type=int, nargs="+", default=[512], help="image sizes")
+
+    args = parser.parse_args(sys.argv[1:] or ["stages"])
+
+    if args.command == "stages":
+        report = bench_stages(args.sizes, list(sweep(args.max_it, args.num_frac, args.num_warpings)),
+                              memory=not args.no_memory)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print("Saved results as {0}.".format(args.output))
+    elif args.command == "julia":
+        for size in args.sizes:
+            bench_julia(size, args.seeds, dict(args.set), args.adaptive)
+    elif args.command == "culling":
+        for size in args.sizes:
+            bench_culling(size, args.radius_offsets, dict(args.set))
+    elif args.command == "vectors":
+        for size in args.sizes:
+            bench_vectors(size, args.rows)
+    elif args.command == "erosion":
+        for size in args.sizes:
+            bench_erosion(size, args.iterations, args.workers, args.tile_size)
+    elif args.command == "noise":
+        bench_noise(args.samples, args.octaves, args.sizes)
+    elif args.command == "warp":
+        for size in args.sizes:
+            bench_warp(size, args.rows)
+    else:
+        for size in args.sizes:
+            bench_parallel(size, args.workers)
@@ -0,0 +1,232 @@
+"""
+Cache of the outputs of the generator, so the same island is never computed twice.
+
+Each stage of the pipeline (warp, julia, salted heightmap, normals, gradients, eroded heightmap) is stored under a key that's a hash
+of the seed, of the values of the general control the stage reads, and of the keys of the stages it comes from.
+So changing only salt_frequency still finds the warp and julia data of the island in the cache, and only
+recomputes the salt and what comes after. Chunks of the infinite world of world.py can be cached the same way.
+
+The cache keeps the most recently used arrays in memory, and the ones that don't fit anymore go to a directory
+on the disk (if one is given), where the least recently used ones are deleted when it gets too big.
+
+Usage : python cache.py --seed 42 [--directory cache]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+import erosion
+import main
+import world
+
+
+"""
+Values of the general control read by each stage, on top of the ones of the stages before it.
+"""
+stage_controls = {
+    "warp": ["imgx", "imgy", "island_noise_frequency", "radius_offset", "num_warpings"],
+    "julia": ["normalization", "noise_estimate_resolution", "noise_sharpness", "max_it", "num_frac", "adaptive_julia",
+              "constant_re_low", "constant_re_high", "constant_im_low", "constant_im_high",
+              "scale_value_low", "scale_value_high", "trans_max_value", "rotation_max_value"],
+    "salt": ["salt_frequency", "low_barrier", "weight_base", "weight_salt"],
+    "normals": [],
+    "gradients": [],
+    "erosion": [name for name in main.control_names if name.startswith("erosion_")],
+}
+
+version = 3  # to change whenever a stage changes what it outputs
+
+
+def stage_key(stage, seed, previous=None, control=None):
+    """
+    Returns the key of the output of a stage, for the given seed and general control (the defaults of main if not given).
+    previous is the key of the stage it comes from.
+    """
+    if control is None:
+        control = main.IslandGenerator().get_control()
+    content = {"version": version, "stage": stage, "seed": seed, "previous": previous,
+               "control": {name: control[name] for name in stage_controls[stage]}}
+    return hashlib.sha256(json.dumps(content, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class TileCache(object):
+    """
+    LRU cache of arrays, in memory up to memory_size bytes, then on the disk in directory up to disk_size bytes.
+    """
+    def __init__(self, memory_size=512 * 2 ** 20, directory=None, disk_size=4 * 2 ** 30):
+        self.memory_size = memory_size
+        self.directory = directory
+        self.disk_size = disk_size
+        self.memory = OrderedDict()
+        self.memory_used = 0
+        self.hits = 0
+        self.misses = 0
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".npy")
+
+    def get(self, key):
+        """
+        Returns the array stored under key, or None if there's none.
+        """
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            self.hits += 1
+            return self.memory[key]
+        if self.directory is not None and os.path.exists(self._path(key)):
+            array = np.load(self._path(key))
+            os.utime(self._path(key))  # the file's time is its last use
+            self.hits += 1
+            self._remember(key, array)
+            return array
+        self.misses += 1
+        return None
+
+    def put(self, key, array):
+        """
+        Stores array under key.
+        """
+        array = np.asarray(array)
+        if key in self.memory:
+            self.memory_used -= self.memory.pop(key).nbytes
+        self._remember(key, array)
+
+    def _remember(self, key, array):
+        self.memory[key] = array
+        self.memory_used += array.nbytes
+        while self.memory_used > self.memory_size and len(self.memory) > 1:
+            old_key, old_array = self.memory.popitem(last=False)
+            self.memory_used -= old_array.nbytes
+            self._spill(old_key, old_array)
+
+    def _spill(self, key, array):
+        """
+        Writes an array that doesn't fit in memory anymore to the disk, and deletes the oldest files if it's too full.
+        """
+        if self.directory is None:
+            return
+        if not os.path.exists(self._path(key)):
+            np.save(self._path(key), array)
+
+        files = [os.path.join(self.directory, name) for name in os.listdir(self.directory) if name.endswith(".npy")]
+        files = sorted(files, key=os.path.getmtime)
+        used = sum(os.path.getsize(name) for name in files)
+        while used > self.disk_size and files:
+            name = files.pop(0)
+            used -= os.path.getsize(name)
+            os.remove(name)
+
+    def clear(self):
+        """
+        Empties the memory and deletes the files on the disk.
+        """
+        self.memory.clear()
+        self.memory_used = 0
+        if self.directory is not None:
+            for name in os.listdir(self.directory):
+                if name.endswith(".npy"):
+                    os.remove(os.path.join(self.directory, name))
+
+
+def _cached(cache, key, compute):
+    array = cache.get(key)
+    if array is None:
+        array = np.asarray(compute())
+        cache.put(key, array)
+    return array
+
+
+def generate(seed, cache, **control):
+    """
+    Same as main.IslandGenerator(seed, **control).generate(), but taking every stage it can from the cache.
+    A seed of None is a new random island each time, which the cache can't hold : it's generated without it.
+    """
+    if seed is None:
+        return main.IslandGenerator(None, **control).generate()
+    generator = main.IslandGenerator(seed, **control)
+    # All the random values are drawn first, since they're cheap and the stages after a cached one still need them.
+    island_offsets, _, salt_offsets = generator.draw_randomness()
+
+    def warp():
+        generator.simplex_offsets = island_offsets
+        return generator.update_warp(freq=generator.island_noise_frequency, seed=False)
+
+    def julia():
+        generator.simplex_offsets = island_offsets
+        top = generator.top("warp", generator.island_noise_frequency)
+        data = main.scale_list(_cached(cache, warp_key, warp), 1.0, top)
+        print("Creating the Julia set data...")
+        return generator.julia_rows(0, generator.imgy, data)
+
+    def salt():
+        data = main.scale_list(_cached(cache, julia_key, julia), 255.0, generator.top("julia"))
+        generator.simplex_offsets = salt_offsets
+        salt_top = generator.top("warp", generator.salt_frequency)
+        return generator.mix_salt(data, generator.update_warp(freq=generator.salt_frequency, seed=False), salt_top)
+
+    def normals():
+        return main.create_normals(_cached(cache, salt_key, salt))
+
+    def gradients():
+        return main.create_gradient_from_normals(_cached(cache, normals_key, normals))
+
+    control = generator.get_control()
+    warp_key = stage_key("warp", seed, control=control)
+    julia_key = stage_key("julia", seed, warp_key, control)
+    salt_key = stage_key("salt", seed, julia_key, control)
+    normals_key = stage_key("normals", seed, salt_key, control)
+    gradients_key = stage_key("gradients", seed, normals_key, control)
+
+    if generator.erosion_iterations <= 0:
+        return _cached(cache, salt_key, salt), _cached(cache, normals_key, normals), _cached(cache, gradients_key, gradients)
+
+    def eroded():
+        return generator.erode(_cached(cache, salt_key, salt), _cached(cache, gradients_key, gradients))[0]
+
+    # only the eroded heightmap is kept, its gradients (and so its normals) come from it as they come out of erode.
+    # With a time budget, the iterations done depend on the speed of the machine, so it's not kept at all.
+    if generator.erosion_seconds:
+        data = eroded()
+    else:
+        data = _cached(cache, stage_key("erosion", seed, gradients_key, control), eroded)
+    eroded = erosion.eroded_gradients(data)
+    return data, erosion.normals_from_gradients(eroded), eroded
+
+
+def generate_chunk(world_seed, cx, cy, cache, size=256, island_size=None, **control):
+    """
+    Same as world.generate_chunk, taking the chunk from the cache if it's already there.
+    Like for generate, a world_seed of None doesn't use the cache.
+    """
+    if world_seed is None:
+        return world.generate_chunk(world_seed, cx, cy, size, island_size, **control)
+    if island_size is None:
+        island_size = control.get("imgx", main.imgx)
+    content = {"version": version, "stage": "chunk", "seed": world_seed, "chunk": [cx, cy, size, island_size],
+               "control": main.IslandGenerator(**control).get_control()}
+    key = hashlib.sha256(json.dumps(content, sort_keys=True).encode("utf-8")).hexdigest()
+    return _cached(cache, key, lambda: world.generate_chunk(world_seed, cx, cy, size, island_size, **control))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generates an island, reusing what's already in the cache.")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the island")
+    parser.add_argument("--directory", default=None, help="directory of the cache on the disk")
+    args = parser.parse_args()
+
+    cache = TileCache(directory=args.directory)
+    for run in range(2):
+        start = time.perf_counter()
+        data, normals, gradients = generate(args.seed, cache)
+        print("Generated in {0:.2f}s ({1} hits, {2} misses).".format(time.perf_counter() - start, cache.hits, cache.misses))
+    main.draw(data)
+    main.draw_from_vectors(normals)
+    main.draw_from_vectors(gradients, filename="island_gradients.png")
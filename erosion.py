@@ -0,0 +1,219 @@
+"""
+Hydraulic and thermal erosion of the heightmap, to wear down the plains and cliffs the salt leaves.
+
+It works on the full precision heightmap of add_salt, as operations on whole arrays. Each iteration :
+ - rains on the land,
+ - lets the water dissolve the ground where it can carry more sediment than it has (its capacity grows with the
+   drop to the next pixels down the slope and with the amount of water) and drop some where it carries too much,
+ - slides the ground down where the slope is steeper than the talus, like loose rocks would,
+ - moves the water, the sediment and the slid ground to the next pixels down the slope,
+ - evaporates some water.
+Whatever reaches the ocean (the pixels at 0 after the salt) is lost, so the coast stays where it was.
+
+Everything goes down the gradients of create_gradient_from_normals : they're the downhill slope in both directions
+(a Sobel filter of the heights divided by 8, the normals being the sum of the normals of the 8 faces around a point).
+The first iteration uses the gradients it's given, and each one after it computes them again from the new heights,
+so erode returns the gradients of the eroded heightmap along with it, and its normals come from them.
+
+Each pixel only depends on the pixels at most 3 pixels away from it at the iteration before, which is what lets
+parallel.erode cut the map in tiles computed on their own for a few iterations (see ErosionState).
+
+The erosion stops after its number of iterations, or after the iteration going over its time budget if it has one
+(so it always does at least one).
+
+    heights, gradients = erode(data, gradients, iterations=50)
+    normals = normals_from_gradients(gradients)
+"""
+
+import time
+
+import numpy as np
+
+
+def gradient_field(heights):
+    """
+    The gradients of create_gradient_from_normals(create_normals(heights)), in float64, as two arrays (x and y).
+    The border of the image gets 0, since create_normals gives it (0, 0, 1).
+    """
+    height, width = heights.shape
+    gx = np.zeros(heights.shape)
+    gy = np.zeros(heights.shape)
+
+    def at(dx, dy):
+        return heights[1 + dy:height - 1 + dy, 1 + dx:width - 1 + dx]
+
+    if height > 2 and width > 2:
+        gx[1:-1, 1:-1] = ((at(-1, -1) + 2.0 * at(-1, 0) + at(-1, 1)) - (at(1, -1) + 2.0 * at(1, 0) + at(1, 1))) / 8.0
+        gy[1:-1, 1:-1] = ((at(-1, -1) + 2.0 * at(0, -1) + at(1, -1)) - (at(-1, 1) + 2.0 * at(0, 1) + at(1, 1))) / 8.0
+    return gx, gy
+
+
+def eroded_gradients(heights):
+    """
+    The gradients erode returns with an eroded heightmap, from the heightmap alone : a float32 array of shape
+    (height, width, 3) like the ones of create_gradient_from_normals.
+    """
+    gradients = np.zeros(np.shape(heights) + (3,), dtype=np.float32)
+    gradients[..., 0], gradients[..., 1] = gradient_field(np.asarray(heights, dtype=np.float64))
+    return gradients
+
+
+def normals_from_gradients(gradients):
+    """
+    The normals of a heightmap from its gradients, as a float32 array of shape (..., 3).
+    The gradients are the x and y of the normal divided by its z, so the normal is (x, y, 1) normalized.
+    """
+    gradients = np.asarray(gradients, dtype=np.float64)
+    normals = np.ones(gradients.shape)
+    normals[..., :2] = gradients[..., :2]
+    normals /= np.sqrt(np.sum(normals * normals, axis=-1, keepdims=True))
+    return normals.astype(np.float32)
+
+
+class ErosionReport(object):
+    """
+    The cost of each iteration of an erosion, to see what the budget buys.
+    """
+    def __init__(self, pixels):
+        self.pixels = pixels  # pixels of the map
+        self.seconds = []  # wall time of each iteration
+        self.budget_reached = False  # True when the time budget stopped the erosion before its iterations
+
+    def add(self, seconds, iterations=1):
+        """
+        Adds iterations that took seconds in all, split evenly between them.
+        """
+        self.seconds.extend([seconds / iterations] * iterations)
+
+    def report(self):
+        """
+        A one line summary of the iterations.
+        """
+        total = sum(self.seconds)
+        iterations = max(len(self.seconds), 1)
+        report = "{0} iterations in {1:.2f}s, {2:.1f} ms per iteration (min {3:.1f}, max {4:.1f}), {5:.1f} M pixels/s".format(
+            len(self.seconds), total, 1000 * total / iterations, 1000 * min(self.seconds or [0.0]),
+            1000 * max(self.seconds or [0.0]), self.pixels * len(self.seconds) / max(total, 1e-9) / 1e6)
+        if self.budget_reached:
+            report += ", stopped by the time budget"
+        return report
+
+
+class ErosionState(object):
+    """
+    What the erosion goes through from an iteration to the next, for a map or a window of it :
+    the heights, the water, the sediment it carries and the gradients (x and y), all float64 arrays,
+    and the ocean, a boolean array.
+
+    step treats the border of the arrays as the border of the image. So on a window of the map, only the pixels
+    at least 3 * n pixels away from its border are right after n steps (the border of the image aside).
+    """
+    def __init__(self, heights, water, sediment, gx, gy, ocean):
+        self.heights = heights
+        self.water = water
+        self.sediment = sediment
+        self.gx = gx
+        self.gy = gy
+        self.ocean = ocean
+
+    @classmethod
+    def start(cls, data, gradients):
+        """
+        The state before the first iteration, for a heightmap and its gradients.
+        """
+        heights = np.array(data, dtype=np.float64)
+        gradients = np.asarray(gradients)
+        return cls(heights, np.zeros(heights.shape), np.zeros(heights.shape),
+                   gradients[..., 0].astype(np.float64), gradients[..., 1].astype(np.float64), heights <= 0)
+
+    def gradients(self):
+        """
+        The gradients of the current heights, as a float32 array of shape (height, width, 3) like the ones of
+        create_gradient_from_normals. After a step, they're the ones of eroded_gradients(self.heights).
+        """
+        gradients = np.zeros(self.heights.shape + (3,), dtype=np.float32)
+        gradients[..., 0] = self.gx
+        gradients[..., 1] = self.gy
+        return gradients
+
+    def _next(self, gradient, axis):
+        """
+        The heights of the next pixels down the slope along an axis (1 for x, 0 for y), or of the pixel itself
+        where the slope is flat along it or goes out of the arrays.
+        """
+        padded = np.pad(self.heights, [(1, 1) if a == axis else (0, 0) for a in (0, 1)], mode="edge")
+        before = padded[:-2, :] if axis == 0 else padded[:, :-2]
+        after = padded[2:, :] if axis == 0 else padded[:, 2:]
+        return np.where(gradient > 0, after, np.where(gradient < 0, before, self.heights))
+
+    def _downhill(self, amount, weight_x, weight_y):
+        """
+        Moves amount to the next pixels down the slope, split between the x and the y directions by their weights.
+        What goes out of the arrays is lost, and where there's no slope, amount stays where it is.
+        """
+        flat = (weight_x + weight_y) == 0
+        moved = np.where(flat, amount, 0.0)
+        along_x = amount * weight_x
+        along_y = amount * weight_y
+        moved[:, 1:] += np.where(self.gx > 0, along_x, 0.0)[:, :-1]
+        moved[:, :-1] += np.where(self.gx < 0, along_x, 0.0)[:, 1:]
+        moved[1:, :] += np.where(self.gy > 0, along_y, 0.0)[:-1, :]
+        moved[:-1, :] += np.where(self.gy < 0, along_y, 0.0)[1:, :]
+        return moved
+
+    def step(self, rain=0.01, capacity=0.5, rate=0.3, deposition=0.3, evaporation=0.05, talus=8.0, thermal=0.25):
+        """
+        One iteration of the erosion (see the top of the module for what it does), changing the arrays in place.
+        """
+        absolute_x, absolute_y = np.abs(self.gx), np.abs(self.gy)
+        total = absolute_x + absolute_y
+        total[total == 0] = 1.0
+        weight_x, weight_y = absolute_x / total, absolute_y / total
+        slope = np.hypot(self.gx, self.gy)
+
+        # The gradients give the direction down the slope, but they don't see the height of the pixel itself,
+        # so what's dissolved and slid is bounded by the drop to the pixels it goes to, or it would pile up in spikes.
+        drop = weight_x * (self.heights - self._next(self.gx, 1)) + weight_y * (self.heights - self._next(self.gy, 0))
+        drop = np.maximum(drop, 0.0)
+
+        # the water dissolves the ground or drops its sediment, never digging under the sea level
+        self.water += rain * ~self.ocean
+        missing = capacity * drop * self.water - self.sediment
+        dissolved = np.where(missing > 0, np.minimum(rate * missing, 0.5 * drop), deposition * missing)
+        dissolved = np.minimum(dissolved, self.heights)
+        self.heights -= dissolved
+        self.sediment += dissolved
+
+        # the ground steeper than the talus slides
+        slid = np.minimum(thermal * np.maximum(slope - talus, 0.0), 0.5 * drop - np.maximum(dissolved, 0.0))
+        slid = np.clip(slid, 0.0, self.heights)
+        self.heights -= slid
+
+        self.heights += self._downhill(slid, weight_x, weight_y)
+        self.water = self._downhill(self.water, weight_x, weight_y) * (1.0 - evaporation)
+        self.sediment = self._downhill(self.sediment, weight_x, weight_y)
+
+        for values in (self.heights, self.water, self.sediment):
+            values[self.ocean] = 0.0
+        self.gx, self.gy = gradient_field(self.heights)
+
+
+def erode(data, gradients, iterations=50, seconds=0.0, report=None, **params):
+    """
+    Erodes a heightmap, given with its gradients (see create_gradient_from_normals), for iterations iterations or
+    until the iteration going over seconds seconds when seconds isn't 0.
+    params are the ones of ErosionState.step. The cost of each iteration is added to report, an ErosionReport.
+    Returns the eroded heightmap (float64) and its gradients (float32, of shape (height, width, 3)).
+    """
+    state = ErosionState.start(data, gradients)
+    start = time.perf_counter()
+    for iteration in range(iterations):
+        if seconds and iteration and time.perf_counter() - start > seconds:
+            if report is not None:
+                report.budget_reached = True
+            break
+        before = time.perf_counter()
+        state.step(**params)
+        if report is not None:
+            report.add(time.perf_counter() - before)
+    return state.heights, state.gradients()
@@ -0,0 +1,122 @@
+"""
+Exports of the heightmap in formats keeping more than 256 levels of height :
+ - 16 bits greyscale PNG,
+ - headerless little-endian raw float32 or uint16 (what engines like Unreal import),
+ - .npy, that can be opened without being loaded with numpy.load(filename, mmap_mode="r").
+
+All of them are written by blocks of rows, so a huge heightmap (even a memory-mapped one) never needs a second
+full copy in memory.
+
+Usage : python export.py [--seed 42] [--formats png16 raw16 raw32 npy]
+"""
+
+import argparse
+import struct
+import zlib
+
+import numpy as np
+
+import main
+
+
+def _top(data, top):
+    if top is None:
+        top = float(np.max(data))
+    return top if top > 0 else 1.0
+
+
+def to_uint16(block, top):
+    """
+    Scales heights so that top becomes 65535, like scale_list does for 255. Negative heights become 0.
+    """
+    return np.clip(np.rint(np.asarray(block, dtype=np.float64) * (65535.0 / top)), 0, 65535).astype(np.uint16)
+
+
+def _blocks(data, block_rows):
+    for y in range(0, data.shape[0], block_rows):
+        yield data[y:y + block_rows]
+
+
+def _png_chunk(f, kind, content):
+    f.write(struct.pack(">I", len(content)))
+    f.write(kind)
+    f.write(content)
+    f.write(struct.pack(">I", zlib.crc32(kind + content) & 0xffffffff))
+
+
+def export_png16(data, filename, top=None, block_rows=256):
+    """
+    Writes the heightmap (of shape (height, width)) as a 16 bits greyscale PNG, top being white (the max by default).
+    The rows are compressed as they come, so only a block of them is ever in memory.
+    """
+    data = np.asanyarray(data)
+    height, width = data.shape
+    top = _top(data, top)
+    compressor = zlib.compressobj(6)
+    with open(filename, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+        _png_chunk(f, b"IHDR", struct.pack(">IIBBBBB", width, height, 16, 0, 0, 0, 0))
+        for block in _blocks(data, block_rows):
+            rows = to_uint16(block, top).astype(">u2")
+            # each row starts with its filter type, 0 being no filter
+            lines = np.zeros((rows.shape[0], 1 + 2 * width), dtype=np.uint8)
+            lines[:, 1:] = rows.view(np.uint8).reshape(rows.shape[0], 2 * width)
+            compressed = compressor.compress(lines.tobytes())
+            if compressed:
+                _png_chunk(f, b"IDAT", compressed)
+        _png_chunk(f, b"IDAT", compressor.flush())
+        _png_chunk(f, b"IEND", b"")
+    print("Saved 16 bits heightmap as {0}.".format(filename))
+
+
+def export_raw(data, filename, dtype="float32", top=None, block_rows=256):
+    """
+    Writes the heightmap as headerless little-endian values, row after row.
+    dtype is either "float32" (the heights as they are) or "uint16" (scaled so that top, the max by default, is 65535).
+    """
+    if dtype not in ("float32", "uint16"):
+        raise ValueError("Raw exports are either float32 or uint16, not {0}".format(dtype))
+    data = np.asanyarray(data)
+    if dtype == "uint16":
+        top = _top(data, top)
+    with open(filename, "wb") as f:
+        for block in _blocks(data, block_rows):
+            if dtype == "uint16":
+                f.write(to_uint16(block, top).astype("<u2").tobytes())
+            else:
+                f.write(np.asarray(block, dtype="<f4").tobytes())
+    print("Saved raw {0} heightmap as {1}.".format(dtype, filename))
+
+
+def export_npy(data, filename, block_rows=256):
+    """
+    Writes the heightmap as a float32 .npy file, that can be memory-mapped with numpy.load(filename, mmap_mode="r").
+    """
+    data = np.asanyarray(data)
+    out = np.lib.format.open_memmap(filename, mode="w+", dtype="<f4", shape=data.shape)
+    for y in range(0, data.shape[0], block_rows):
+        out[y:y + block_rows] = data[y:y + block_rows]
+    out.flush()
+    del out
+    print("Saved heightmap as {0}.".format(filename))
+
+
+exporters = {
+    "png16": lambda data, name: export_png16(data, name + ".png"),
+    "raw16": lambda data, name: export_raw(data, name + ".r16", dtype="uint16"),
+    "raw32": lambda data, name: export_raw(data, name + ".r32", dtype="float32"),
+    "npy": lambda data, name: export_npy(data, name + ".npy"),
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generates an island and exports its heightmap.")
+    parser.add_argument("--seed", type=int, default=None, help="seed of the island, random by default")
+    parser.add_argument("--formats", nargs="+", choices=sorted(exporters), default=["png16", "raw16", "npy"],
+                        help="formats to export the heightmap to")
+    parser.add_argument("--name", default="images/island_height", help="path of the files, without extension")
+    args = parser.parse_args()
+
+    data, normals, gradients = main.IslandGenerator(args.seed).generate()
+    for name in args.formats:
+        exporters[name](data, args.name)
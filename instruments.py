@@ -0,0 +1,173 @@
+"""
+Instrumentation of the stages of the generator.
+
+Give an Instruments to a generator (or to draw, draw_from_vectors and ImageWriter) and each of its stages
+(update_warp, update_julia, add_salt, create_normals, create_gradient_from_normals, erode, draw, draw_from_vectors)
+gets measured :
+ - its wall time and the CPU time of the thread running it,
+ - the peak RSS of the process when it ends (the peak since the process started, not only during the stage),
+ - the number of pixels it went through,
+ - for update_julia, the total number of iterations and the average per pixel and fractal.
+Each measure is a dict handed to every sink of the Instruments.
+
+    instruments = Instruments(LogSink(), JsonSink("stages.jsonl"))
+    generator = IslandGenerator(42, instruments=instruments)
+
+Without instruments (the default), each stage only checks that there are none, which costs nothing next to a stage.
+
+Sinks are objects with a record(measure) method. There are a few :
+ - LogSink logs each measure as "key=value" pairs with the logging module,
+ - JsonSink appends each measure as a line of JSON to a file,
+ - MemorySink keeps them in a list,
+ - PrometheusSink adds them up into metrics in the Prometheus text format, that it can serve over HTTP.
+"""
+
+import json
+import logging
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+try:
+    import resource
+except ImportError:  # not on Windows
+    resource = None
+
+
+def peak_rss():
+    """
+    The peak resident memory of the process so far, in bytes, or None where it's not known.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024  # bytes on macOS, kilobytes on Linux and the BSDs
+
+
+class Instruments(object):
+    """
+    Measures stages and hands the measures to its sinks.
+    """
+    def __init__(self, *sinks):
+        self.sinks = list(sinks)
+
+    @contextmanager
+    def stage(self, name, pixels, counters=None):
+        """
+        Measures the with block as the stage name going through pixels pixels.
+        counters is the JuliaCounters of the generator, for the stages running the julia set.
+        """
+        iterations, evaluations = (counters.iterations, counters.evaluations) if counters is not None else (0, 0)
+        wall = time.perf_counter()
+        cpu = time.thread_time()
+        yield
+        measure = {"stage": name, "time": time.time(), "wall_seconds": time.perf_counter() - wall,
+                   "cpu_seconds": time.thread_time() - cpu, "peak_rss_bytes": peak_rss(), "pixels": int(pixels)}
+        if counters is not None:
+            iterations = counters.iterations - iterations
+            evaluations = counters.evaluations - evaluations
+            measure["julia_iterations"] = iterations
+            measure["julia_iterations_average"] = iterations / evaluations if evaluations else 0.0
+        for sink in self.sinks:
+            sink.record(measure)
+
+
+class LogSink(object):
+    """
+    Logs each measure on one line, as "key=value" pairs.
+    """
+    def __init__(self, logger="island", level=logging.INFO):
+        self.logger = logging.getLogger(logger) if isinstance(logger, str) else logger
+        self.level = level
+
+    def record(self, measure):
+        self.logger.log(self.level, " ".join("{0}={1}".format(key, value) for key, value in measure.items()))
+
+
+class JsonSink(object):
+    """
+    Appends each measure to a file, as a line of JSON.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self.lock = threading.Lock()
+
+    def record(self, measure):
+        with self.lock, open(self.filename, "a") as f:
+            f.write(json.dumps(measure) + "\n")
+
+
+class MemorySink(object):
+    """
+    Keeps the measures in a list.
+    """
+    def __init__(self):
+        self.measures = []
+
+    def record(self, measure):
+        self.measures.append(measure)
+
+
+class PrometheusSink(object):
+    """
+    Adds the measures up by stage into metrics, given in the Prometheus text format by text(),
+    or over HTTP by serve().
+    """
+    totals = [("runs", "island_stage_runs_total", "Number of times the stage ran"),
+              ("wall_seconds", "island_stage_wall_seconds_total", "Wall time spent in the stage"),
+              ("cpu_seconds", "island_stage_cpu_seconds_total", "CPU time spent in the stage"),
+              ("pixels", "island_stage_pixels_total", "Pixels gone through by the stage"),
+              ("julia_iterations", "island_julia_iterations_total", "Iterations of the julia set")]
+
+    def __init__(self):
+        self.stages = {}
+        self.peak_rss = None
+        self.lock = threading.Lock()
+
+    def record(self, measure):
+        with self.lock:
+            stage = self.stages.setdefault(measure["stage"], {key: 0 for key, name, description in self.totals})
+            stage["runs"] += 1
+            for key, name, description in self.totals[1:]:
+                stage[key] += measure.get(key, 0)
+            if measure["peak_rss_bytes"] is not None:
+                self.peak_rss = max(self.peak_rss or 0, measure["peak_rss_bytes"])
+
+    def text(self):
+        lines = []
+        with self.lock:
+            for key, name, description in self.totals:
+                lines.append("# HELP {0} {1}".format(name, description))
+                lines.append("# TYPE {0} counter".format(name))
+                for stage, values in sorted(self.stages.items()):
+                    if key != "julia_iterations" or values[key]:
+                        lines.append('{0}{{stage="{1}"}} {2}'.format(name, stage, values[key]))
+            if self.peak_rss is not None:
+                lines.append("# HELP island_peak_rss_bytes Peak resident memory of the processes measured")
+                lines.append("# TYPE island_peak_rss_bytes gauge")
+                lines.append("island_peak_rss_bytes {0}".format(self.peak_rss))
+        return "\n".join(lines) + "\n"
+
+    def serve(self, host="127.0.0.1", port=9100):
+        """
+        Serves the metrics on http://host:port/metrics from a background thread. Returns the HTTP server.
+        """
+        sink = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = sink.text().encode("utf-8")
+                self.send_response(200 if self.path == "/metrics" else 404)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = HTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
@@ -23,10 +23,20 @@ serex.alexandre@gmail.com
 
 
 
+import argparse
 import random, math
-from PIL import Image, ImageDraw
-from vector import Vector
-from noise import snoise2
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+import numpy as np
+from PIL import Image
+from vector import VectorField
+import erosion
+import simplex
+
+try:
+    from noise import snoise2
+except ImportError:  # the noise library is compiled, simplex.py gives the same values with numpy only
+    snoise2 = None
 
 
 """
@@ -56,12 +66,15 @@ num_warpings = 2  # This represents the number of warpings we're going to do. 2
 
 noise_sharpness = 0.4  # value by which the noise is put to the power of. Higher = more cliffs, lower = more flat island
 
+noise_backend = "numpy"  # "numpy" computes the simplex noise of whole arrays with simplex.py, "noise" calls snoise2 of the noise library once per sample. Both give the same values
+
 """
 Values for fractal control
 """
 
 max_it = 24  # Max number of iterations before breaking for the Julia set calculations
 num_frac = 8  # Number of fractals we're going to use
+adaptive_julia = 0  # Smallest rectangle the adaptive julia evaluation subdivides (see julia_adaptive), 0 to iterate every pixel
 
 constant_re_low = -0.1  # Lower bound of the random real value of the constant that's being added in the Julia function
 constant_re_high = -0.1  # Higher bound of the random real value of the constant that's being added in the Julia function
@@ -84,6 +97,43 @@ weight_base = 2.0  # weight of the base layer of the island opposing the salt
 weight_salt = 1.0  # weight of the salt layer added to the island
 
 
+"""
+Values for erosion control (see erosion.py)
+"""
+
+erosion_iterations = 0  # Number of iterations of the erosion after the salt, 0 to keep the island as it is
+erosion_seconds = 0.0  # Time budget of the erosion : it stops after the iteration going over it. 0 to always do every iteration
+erosion_rain = 0.01  # Water falling on each pixel of land at each iteration
+erosion_capacity = 0.5  # Sediment the water can carry, for each unit of water and of drop to the next pixels
+erosion_rate = 0.3  # Part of what the water can still carry that it dissolves from the ground at each iteration
+erosion_deposition = 0.3  # Part of what the water carries over its capacity that it drops at each iteration
+erosion_evaporation = 0.05  # Part of the water that evaporates at each iteration
+erosion_talus = 8.0  # Slope over which the ground slides down
+erosion_thermal = 0.25  # Part of the slope over the talus that slides at each iteration. Keep under 0.5
+
+
+"""
+Values for scaling control
+"""
+
+normalization = "image"  # "image" scales the noise and julia data by their max over the whole image, "bounded" by ranges known before generating them
+noise_estimate_resolution = 64  # width and height of the low resolution pass estimating the range of the noise in "bounded" normalization
+
+
+"""
+Names of all the values above. They're the defaults of every IslandGenerator, which can change any of them.
+"""
+control_names = ["imgx", "imgy",
+                 "island_noise_frequency", "radius_offset", "num_warpings", "noise_sharpness", "noise_backend",
+                 "max_it", "num_frac", "adaptive_julia",
+                 "constant_re_low", "constant_re_high", "constant_im_low", "constant_im_high",
+                 "scale_value_low", "scale_value_high", "trans_max_value", "rotation_max_value",
+                 "salt_frequency", "low_barrier", "weight_base", "weight_salt",
+                 "erosion_iterations", "erosion_seconds", "erosion_rain", "erosion_capacity", "erosion_rate",
+                 "erosion_deposition", "erosion_evaporation", "erosion_talus", "erosion_thermal",
+                 "normalization", "noise_estimate_resolution"]
+
+
 """
 !!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!
 !!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!
@@ -93,303 +143,1007 @@ weight_salt = 1.0  # weight of the salt layer added to the island
 """
 
 
-def create_z(x, y, rand):
+def clamp(value, min_value, max_value):
     """
-    This creates a number that is rotated, scaled and translated all base on a single random number.
-    It's used to apply these transformations to the Julia fractals we're going to use for our noise.
+    A helper to clamp a value between two others.
     """
-    alpha = 2.0 * math.pi * rand * rotation_max_value
-    scale = clamp(scale_value_high * rand, scale_value_low, scale_value_high)
-    trans = (rand * 2.0 - 1.0) * trans_max_value
-    zx = ((x * math.sin(alpha) + y * math.cos(alpha)) + trans) * scale
-    zy = ((x * math.cos(alpha) - y * math.sin(alpha)) + trans) * scale
-    return zx + zy * 1j
+    return max(min(value, max_value), min_value)
 
 
-def make_complex(re1=constant_re_low, re2=constant_re_high, im1=constant_im_low, im2=constant_im_high):
+def measure(instruments, stage, pixels, counters=None):
     """
-    This is a helper to create a complex number that might be random, depending on the given bounds given to it.
-    I use this function to create the different constant values that are added to Z in the julia function.
-    I found these default values to give the best results, since the julia set of c = 0 + 1j looks the morst like some mountain.
-    Also, it's way more predictable than anything else.
+    Measures the with block as a stage going through pixels pixels, when instruments (see instruments.py) are given.
+    Without instruments it does nothing, so the stages don't cost more when nobody measures them.
     """
-    x = random.uniform(re1, re2)
-    y = random.uniform(im1, im2)
-    return x + y * 1j
+    if instruments is None:
+        return nullcontext()
+    return instruments.stage(stage, pixels, counters)
 
 
-def clamp(value, min_value, max_value):
+def snoise2_grid(xs, ys, octaves, base):
     """
-    A helper to clamp a value between two others.
+    snoise2 of the noise library for each (x, y) of the arrays xs and ys. The library only has a scalar function,
+    so this calls it once per sample.
     """
-    return max(min(value, max_value), min_value)
+    values = np.fromiter((snoise2(x, y, octaves=octaves, base=base) for x, y in zip(xs.ravel().tolist(), ys.ravel().tolist())),
+                         dtype=np.float64, count=xs.size)
+    return values.reshape(xs.shape)
+
+
+"""
+The backends of IslandGenerator.fbm_grid, by the name noise_backend gives them. They all take the arrays xs and ys,
+the octaves and the base, and give the same values (simplex.py reproduces snoise2 bit for bit).
+"noise" is only there when the noise library is installed.
+"""
+noise_backends = {"numpy": lambda xs, ys, octaves, base: simplex.fbm2(xs, ys, octaves, base=base)}
+if snoise2 is not None:
+    noise_backends["noise"] = snoise2_grid
 
 
-def julia(z, c, limit=2.0):
+class JuliaCounters(object):
     """
-    This function iterates over a given position in the gaussian plan and returns the number of iterations needed to either :
-     - reach the maximum number of iterations allowed by max_it
-     - reach the limit, 2.0 by default but defined by our simplex noise for our island generation.
+    Counts the work done by julia_grid and IslandGenerator.julia_max, to see what their shortcuts save.
     """
-    i = 0
+    def __init__(self):
+        self.evaluations = 0  # number of (pixel, fractal) couples asked for
+        self.skipped = 0  # evaluations not done since the pixel already had the highest count possible
+        self.iterations = 0  # iterations actually computed, for all the pixels of all the fractals
+        self.periodic = 0  # pixels stopped early since their orbit came back on itself
+        self.periodic_saved = 0  # iterations these pixels would still have gone through
+        self.culled = 0  # evaluations not done since the pixel is in the ocean, see IslandGenerator.land_spans
+        self.pixels = 0  # pixels asked for to IslandGenerator.julia_adaptive
+        self.filled = 0  # pixels it filled from the border of their rectangle, without running any fractal
+        self.mismatched = 0  # filled pixels that didn't get the count they would have, when checking it
+
+    def report(self, max_it):
+        """
+        A one line summary of the counters.
+        """
+        evaluations = max(self.evaluations, 1)
+        report = ("{0} evaluations, {1} culled ({2:.1%}), {3} skipped ({4:.1%}), {5} iterations ({6:.2f} per evaluation, "
+                  "at most {7}), {8} periodic pixels saving {9} iterations").format(
+            self.evaluations, self.culled, self.culled / evaluations, self.skipped, self.skipped / evaluations,
+            self.iterations, self.iterations / evaluations, max_it, self.periodic, self.periodic_saved)
+        if self.pixels:
+            report += ", {0} pixels filled ({1:.1%}), {2} mismatched".format(
+                self.filled, self.filled / self.pixels, self.mismatched)
+        return report
+
+
+def julia_grid(z, c, limit=2.0, max_it=max_it, periodicity=False, tolerance=1e-6, counters=None):
+    """
+    Same as IslandGenerator.julia, but iterating a whole array of positions at once.
+
+    limit can either be a single value or an array of the same shape as z (one limit per pixel).
+    Pixels are dropped from the working set as soon as they escape, so the late iterations only cost
+    what's left inside the set. Returns the same iteration counts as julia would for each position.
+
+    With periodicity, z is compared to a copy of itself saved at the iterations 1, 2, 4, 8... (Brent's method).
+    When it comes back to it (closer than tolerance), the orbit is stuck in a cycle whose values all stayed under
+    the limit, so it will never escape : the pixel is dropped with the count of the points inside the set.
+    It's off by default : the default constants (around 0 + 1j) make Julia sets without any inside, and even for
+    the others the extra comparisons cost about as much as the iterations they save.
+    counters, if given, is a JuliaCounters updated with the work done.
+    """
+    shape = np.shape(z)
+    z = np.array(z, dtype=np.complex128).ravel()
+    limit = np.broadcast_to(np.asarray(limit, dtype=np.float64), shape).ravel()
+
+    # julia returns the last value of its loop counter when it never escapes
+    counts = np.full(z.size, max(int(max_it) - 1, 0), dtype=np.int32)
+    active = np.arange(z.size)
+    saved = z
+    next_save = 1
     for i in range(int(max_it)):
-        if abs(z) > limit:
-            break
+        escaped = np.abs(z) > limit
+        if escaped.any():
+            counts[active[escaped]] = i
+            inside = ~escaped
+            active = active[inside]
+            z = z[inside]
+            limit = limit[inside]
+            if periodicity:
+                saved = saved[inside]
+            if active.size == 0:
+                break
+        if counters is not None:
+            counters.iterations += active.size
         z = z * z + c
-    return i
 
-
-def update_julia(warp_data=None, rang=1):
+        if periodicity and i + 1 < max_it:
+            if i + 1 == next_save:
+                saved = z
+                next_save *= 2
+            else:
+                cycling = np.abs(z - saved) < tolerance
+                if cycling.any():
+                    if counters is not None:
+                        counters.periodic += int(cycling.sum())
+                        counters.periodic_saved += int(cycling.sum()) * (int(max_it) - 1 - i)
+                    inside = ~cycling
+                    active = active[inside]
+                    z = z[inside]
+                    limit = limit[inside]
+                    saved = saved[inside]
+                    if active.size == 0:
+                        break
+    return counts.reshape(shape)
+
+
+def _ranges(starts, lengths, step=1):
     """
-    This is the main julia calculations function.
-
-    warp_data is where we put the noise to create our island with.
-    rang is juste the range of the output (by default from -1 - 1j to 1 + 1j).
+    The ranges start, start + step... (length values) for each start and length, one after the other in a single array.
     """
-    xa = -rang
-    xb = rang
-    ya = -rang
-    yb = rang
-
-    color = []  # Holds our final color for this batch
-    cs = []  # collection of the c numbers we need for each fractal
-    zs_rand = []  # list of the random numbers used to transform our z-coordinates with the create_z function
-
-    # lets populate our constant and Z-seeds
-    for i in range(num_frac):
-        cs.append(make_complex())
-        zs_rand.append(random.random())
-
-    count = 0
-    print("Creating the Julia set data...")
-    for y in range(imgy):
-        zy = y * (yb - ya) / (imgy - 1) + ya
-        for x in range(imgx):
-            zx = x * (xb - xa) / (imgx - 1) + xa
-
-            # Here we're keeping the max value of each fractal for each point
-            vs = []
-            for i in range(num_frac):
-                if warp_data is not None:
-                    vs.append(julia(create_z(zx, zy, zs_rand[i]), cs[i], warp_to_julia(warp_data[count])))
-                else:
-                    vs.append(julia(create_z(zx, zy, zs_rand[i]), cs[i]))
-            v = max(vs)
-            color.append(v)
-            count += 1
-    return color
+    lengths = np.asarray(lengths, dtype=np.int64)
+    offsets = np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return np.repeat(np.asarray(starts, dtype=np.int64), lengths) + (np.arange(offsets.size) - offsets) * step
 
 
 """
 !!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!
 !!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!
-!!!!!!!!!!!!!!!!! NOISE CORE !!!!!!!!!!!!!!!!!!
+!!!!!!!!!!!!! NORMALS & GRADIENT !!!!!!!!!!!!!!
 !!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!
 !!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!
 """
 
 
-def fbm(vec, octaves=8, freq=5.0):
-    """
-    Simple wrapper for the function we're using from the noise library.
-    """
-    return snoise2(vec[0] / freq, vec[1] / freq, octaves=octaves, base=origin)
+"""
+Positions of the 8 neighbours of a point, going around it, as (x, y) offsets.
+"""
+neighbours = [(-1, -1), (0, -1), (1, -1), (1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0)]
 
 
-def warp(p, freq=5.0):
+def create_normals(values, row_start=0, row_end=None, block_rows=256, instruments=None):
     """
-    This is the core warp function, gotten from Inigo Quilez ( <3 )
+    Computes the normals of the heightmap, as the sum of the normals of the 8 faces around each point.
+    The points on the border of the image just get (0, 0, 1).
 
-    It takes a position (as a vector) on entry.
-    Returns a float value between -1 and 1.
-    The more warping, the closer to 0 the value will get, so scale it up before writing it to an image.
+    This is done as operations on whole arrays, by blocks of block_rows rows, so apart from the output there's
+    only a few blocks' worth of temporary data.
+    row_start and row_end let you compute only some rows of the image, values still being the whole heightmap.
+    Returns a float32 array of shape (row_end - row_start, width, 3).
     """
-    updated_value = Vector(0, 0)
-    for i in range(num_warpings):
-        off1 = simplex_offsets[2 * i]
-        off2 = simplex_offsets[2 * i + 1]
-        updated_value = Vector(fbm(p + updated_value * 4.0 + Vector(off1[0], off1[1]), freq=freq),
-                               fbm(p + updated_value * 4.0 + Vector(off2[0], off2[1]), freq=freq))
-    return fbm(p + updated_value * 4.0, freq=freq)
+    values = np.asarray(values, dtype=np.float64)
+    height, width = values.shape
+    if row_end is None:
+        row_end = height
+    if row_start == 0:
+        print("Creating normals...")
+    with measure(instruments, "create_normals", (row_end - row_start) * width):
+        return _normals_rows(values, row_start, row_end, block_rows)
+
+
+def _normals_rows(values, row_start, row_end, block_rows):
+    height, width = values.shape
+    normals = np.zeros((row_end - row_start, width, 3), dtype=np.float32)
+    normals[..., 2] = 1.0
+    for start in range(max(row_start, 1), min(row_end, height - 1), block_rows):
+        end = min(start + block_rows, row_end, height - 1)
+        center = values[start:end, 1:width - 1]
+
+        # Each face is made of the center and two neighbours following each other around it.
+        # Its normal is the cross product of the two vectors going from the center to the neighbours.
+        # The x and y of these vectors are the same for every point, only their height is an array.
+        normal = VectorField(np.zeros(center.shape), np.zeros(center.shape), 0.0)
+        dx, dy = neighbours[-1]
+        first = VectorField(dx, dy, values[start + dy:end + dy, 1 + dx:width - 1 + dx] - center)
+        for dx, dy in neighbours:
+            second = VectorField(dx, dy, values[start + dy:end + dy, 1 + dx:width - 1 + dx] - center)
+            normal += first.cross(second)
+            first = second
+
+        normal.normalize().to_array(out=normals[start - row_start:end - row_start, 1:width - 1])
+    return normals
 
 
-def seed_warp():
+def create_gradient_from_normals(normals, instruments=None):
     """
-    This function is called between each update_warp to have some random simplex positions and create different noise each time.
+    Computes the slope at each point from its normal, as an array of the same shape as normals (..., 3).
+    Where the normal points up, it's the slope in both directions. Elsewhere, it's just the normalized direction.
     """
-    global simplex_offsets
-    simplex_offsets = []
-    for i in range(2 * num_warpings):
-        simplex_offsets.append((random.uniform(-10000, 10000), random.uniform(-10000, 10000)))
+    with measure(instruments, "create_gradient_from_normals", np.size(normals) // 3):
+        return _gradients(normals)
+
+
+def _gradients(normals, block_pixels=65536):
+    # by blocks of pixels, so only a block of the normals is ever converted to float64
+    normals = np.asarray(normals)
+    gradients = np.zeros(normals.shape, dtype=np.float32)
+    flat_normals, flat_gradients = normals.reshape(-1, 3), gradients.reshape(-1, 3)
+    for start in range(0, len(flat_normals), block_pixels):
+        block = VectorField.from_array(flat_normals[start:start + block_pixels])
+        divisor = np.where(block.z > 0, block.z, np.hypot(block.x, block.y))
+        divisor[divisor == 0] = 1.0  # only possible when not up, and then the direction is just 0
+        VectorField(block.x / divisor, block.y / divisor).to_array(out=flat_gradients[start:start + block_pixels, :2])
+    return gradients
 
 
-def transform_warp(x, y, simplex):
+def vectors_image(normals, block_pixels=65536):
     """
-    This function gives you control over the noise you're going to feed to the Julia set for it's limits.
-    It's inputed with the simplex value for the position(x, y)
-
-    What I've done here is giving it a factor that depends on the distance to the center of given point (x, y).
-    So basically, making the noise 0 at the edge of the island and island_height at the center of it.
+    Makes an RGB image out of vectors (normals or gradients) of shape (height, width, 3),
+    each component being scaled to 255 on its own.
     """
-    dist_center = math.sqrt((x - imgx / 2) ** 2 + (y - imgy / 2) ** 2) / (imgx / 2)
-    island_radius = (dist_center + radius_offset)
-    factor = 1 - (island_radius ** 2)
-    if island_radius > 1:
-        factor = 0
-    simplex *= factor
+    normals = np.asarray(normals)
+    # the same scaling as scale_list, but by blocks of pixels, so only a block is ever converted to float64
+    tops = [float(normals[..., i].max()) for i in range(3)]
+    factors = [255.0 / top if top > 0.0 else 0.0 for top in tops]
+    pixels = np.empty(normals.shape, dtype=np.uint8)
+    flat_normals, flat_pixels = normals.reshape(-1, 3), pixels.reshape(-1, 3)
+    for start in range(0, len(flat_normals), block_pixels):
+        block = VectorField.from_array(flat_normals[start:start + block_pixels])
+        # int() truncates, and the colors that can't be drawn (negative ones) end up black
+        channels = VectorField(*(np.clip(np.trunc(c * factor), 0, 255) for c, factor in zip(block, factors)))
+        channels.to_array(out=flat_pixels[start:start + block_pixels])
+    return Image.fromarray(pixels, "RGB")
+
+
+def draw_from_vectors(normals, filename="island_normals.png", instruments=None):
+    """
+    This function draws the given vectors to an image, all at once.
+    """
+    with measure(instruments, "draw_from_vectors", np.size(normals) // 3):
+        vectors_image(normals).save("images/" + filename, "PNG")
+    print("Saved normals as {0}.".format(filename))
 
-    return simplex
+
+"""
+!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!
+!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!
+!!!!!!!!!!!!!!!! GENERAL CORE !!!!!!!!!!!!!!!!!
+!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!
+!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!
+"""
 
 
-def warp_to_julia(warp_value):
+def height_image(data):
     """
-    This function converts the float value of the warped noise at some point (x, y) (so between -1 and 1) to return a float.
-    The returned value will be used by the julia function as it's limit.
+    Makes a grey RGB image out of the heightmap, scaled so its max is 255.
+    """
+    draw_data = scale_list(data, 255.0)
+    grey = np.minimum(np.trunc(np.abs(draw_data)), 255).astype(np.uint8)
+    return Image.fromarray(grey, "L").convert("RGB")
 
-    You can play with this function a bit to see how it changes the island.
-    Try to keep the return value positive though.
+
+def draw(data, filename="island.png", instruments=None):
+    """
+    This function draws the given data to an image, all at once.
     """
-    return 2.0 * math.fabs(warp_value) ** noise_sharpness  # more flat (don't try on your girlfriend)
+    with measure(instruments, "draw", np.size(data)):
+        height_image(data).save("images/" + filename, "PNG")
+    print("Saved image as {0}.".format(filename))
 
 
-def update_warp(freq=5.0):
+class ImageWriter(object):
     """
-    This is the function calculating our base warped noise.
+    Saves the images on background threads, so the next island can be generated meanwhile.
+    The image is made right away (that's fast), only the encoding and writing of the file is left to the threads.
 
-    It gets the value from the core warp function, lets you modify it as you wish, and return all of the values for the image.
+    Use it like this :
+        with ImageWriter() as writer:
+            writer.draw(data)
+            writer.draw_from_vectors(normals)
+    Leaving the with block waits for all the images to be saved.
+
+    With instruments, draw and draw_from_vectors are measured on the threads, and only count the encoding and writing.
     """
-    data_warp = []
-    seed_warp()
-    print("Creating some warped noise...")
-    for y in range(imgy):
-        for x in range(imgx):
-            simplex = warp(Vector(x / imgx, y / imgy), freq=freq)
-            simplex = transform_warp(x, y, simplex)
-            data_warp.append(simplex)
-    return data_warp
+    def __init__(self, threads=3, instruments=None):
+        self.executor = ThreadPoolExecutor(threads)
+        self.pending = []
+        self.instruments = instruments
 
+    def _save(self, image, filename, message, stage):
+        with measure(self.instruments, stage, image.width * image.height):
+            image.save("images/" + filename, "PNG")
+        print(message.format(filename))
 
-"""
-!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!
-!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!
-!!!!!!!!!!!!! NORMALS & GRADIENT !!!!!!!!!!!!!!
-!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!
-!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!
-"""
+    def draw(self, data, filename="island.png"):
+        self.pending.append(self.executor.submit(self._save, height_image(data), filename, "Saved image as {0}.",
+                                                 "draw"))
 
+    def draw_from_vectors(self, normals, filename="island_normals.png"):
+        self.pending.append(self.executor.submit(self._save, vectors_image(normals), filename, "Saved normals as {0}.",
+                                                 "draw_from_vectors"))
 
-def get_face_normal(center, p1, p2):
-    first = p1 - center
-    second = p2 - center
-    return first ** second
-
-
-def create_normals(values):
-    normals = []
-    count = 0
-    print("Creating normals...")
-    for x in range(imgx):
-        for y in range(imgy):
-            normal = Vector(0.0, 0.0, 0.0)
-            center = Vector(x, y, values[count])
-            if 0 < x < imgx - 1 and 0 < y < imgy - 1:
-                normal += get_face_normal(center, Vector(x-1, y-1, values[count - imgy - 1]), Vector(x, y-1, values[count - imgy]))
-                normal += get_face_normal(center, Vector(x, y-1, values[count - imgy]), Vector(x+1, y-1, values[count - imgy + 1]))
-                normal += get_face_normal(center, Vector(x+1, y-1, values[count - imgy + 1]), Vector(x+1, y, values[count + 1]))
-                normal += get_face_normal(center, Vector(x+1, y, values[count + 1]), Vector(x+1, y+1, values[count + imgy + 1]))
-                normal += get_face_normal(center, Vector(x+1, y+1, values[count + imgy + 1]), Vector(x, y+1, values[count + imgy]))
-                normal += get_face_normal(center, Vector(x, y+1, values[count + imgy]), Vector(x-1, y+1, values[count + imgy - 1]))
-                normal += get_face_normal(center, Vector(x-1, y+1, values[count + imgy - 1]), Vector(x-1, y, values[count - 1]))
-                normal += get_face_normal(center, Vector(x-1, y, values[count - 1]), Vector(x-1, y-1, values[count - imgy - 1]))
-            else:
-                normal = Vector(0.0, 0.0, 1.0)
-            normals.append(normal.normalize())
-            count += 1
-    return normals
+    def wait(self):
+        """
+        Waits for all the images given so far to be saved, and raises the error if one of them failed.
+        """
+        pending, self.pending = self.pending, []
+        for future in pending:
+            future.result()
 
+    def close(self):
+        self.wait()
+        self.executor.shutdown()
 
-def create_gradient_from_normals(normals):
-    gradients = []
-    print("Creating gradients...")
-    for normal in normals:
-        if normal[2] > 0:
-            gradients.append(Vector(normal[0] / normal[2], normal[1] / normal[2], 0.0))
-        else:
-            gradients.append(Vector(normal[0], normal[1], 0.0).normalize())
-    return gradients
+    def __enter__(self):
+        return self
 
+    def __exit__(self, *args):
+        self.close()
 
-def draw_from_vectors(normals, filename="island_normals.png"):
-    """
-    This function draws the given data as a 1d list to the image.
+
+def scale_list(l, max_value, top=None):
     """
-    red, green, blue = [list(x) for x in zip(*normals)]
-    red = scale_list(red, 255.0)
-    green = scale_list(green, 255.0)
-    blue = scale_list(blue, 255.0)
+    This simple helper scales every item of a list by the necessary factor to the maximum value of the list reaches max_value.
+    Not really suited as is for list containing negative values.
+    Works on lists as well as arrays, and always returns an array.
 
-    im = ImageDraw.Draw(image)
-    for i, p in enumerate(data_xy):
-        im.point(p, fill=(int(red[i]), int(green[i]), int(blue[i])))
-    del im
-    image.save("images/" + filename, "PNG")
-    print("Saved normals as {0}.".format(filename))
+    If top is given, it's used instead of the maximum of the list, for when the list is only a part of a bigger image.
+    """
+    l = np.asarray(l)
+    if top is None:
+        top = l.max()
+    if top <= 0.0:
+        return np.zeros(l.shape)
+    factor = max_value / top
+    return l * factor
 
 
 """
 !!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!
 !!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!
-!!!!!!!!!!!!!!!! GENERAL CORE !!!!!!!!!!!!!!!!!
+!!!!!!!!!!!!!! ISLAND GENERATOR !!!!!!!!!!!!!!!
 !!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!
 !!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!
 """
 
 
-def draw(data, filename="island.png"):
-    """
-    This function draws the given data as a 1d list to the image.
+class IslandGenerator(object):
     """
-    draw_data = scale_list(data, 255.0)
+    Holds everything needed to generate islands : the values of the general control and the randomness.
 
-    im = ImageDraw.Draw(image)
-    for i, p in enumerate(data_xy):
-        color = int(math.fabs(draw_data[i]))
-        im.point(p, fill=(color, color, color))
-    del im
-    image.save("images/" + filename, "PNG")
-    print("Saved image as {0}.".format(filename))
+    Every value of the general control can be changed by name when creating it, the others keep the defaults above :
+        generator = IslandGenerator(seed=42, imgx=512, imgy=512, max_it=32)
+        data, normals, gradients = generator.generate()
 
+    The randomness is its own, so generators never change each other's islands (or the global random module).
+    Generating several islands with the same generator gives different ones, like running main.py several times.
 
-def scale_list(l, max_value):
+    The values origin and the ones in the list simplex_offsets are used for the different simplex noises we're going to generate for the domain warping.
+    They need to be consistent throughout each warping process.
+
+    instruments (see instruments.py) measure each stage of generate, and aren't part of the general control.
     """
-    This simple helper scales every item of a list by the necessary factor to the maximum value of the list reaches max_value.
-    Not really suited as is for list containing negative values.
+    def __init__(self, seed=None, instruments=None, **control):
+        self.set_control(dict(((name, globals()[name]) for name in control_names), **control))
+        self.random = random.Random(seed)
+        self.origin = self.random.uniform(-10000, 10000)
+        self.simplex_offsets = []
+        self.cs = []  # collection of the c numbers we need for each fractal
+        self.zs_rand = []  # list of the random numbers used to transform our z-coordinates with the create_z function
+        self.julia_counters = JuliaCounters()  # work done by julia_max, see JuliaCounters
+        self.instruments = instruments
+        self.cull_ocean = True  # only compute the pixels of the island, see land_spans
+        self._land_spans = None
+        self.erosion_report = None  # cost of the iterations of the last erosion, see erode
+
+    def get_control(self):
+        """
+        Returns the values of the general control as a dict.
+        """
+        return {name: getattr(self, name) for name in control_names}
+
+    def set_control(self, values):
+        """
+        Sets values of the general control from a dict like the one get_control returns.
+        """
+        for name, value in values.items():
+            if name not in control_names:
+                raise KeyError("Unknown control value: {0}".format(name))
+            setattr(self, name, value)
+
+    """
+    Fractal core
     """
-    if max(l) <= 0.0:
-        return [0] * len(l)
-    factor = max_value / max(l)
-    return [d * factor for d in l]
 
+    def create_z(self, x, y, rand):
+        """
+        This creates a number that is rotated, scaled and translated all base on a single random number.
+        It's used to apply these transformations to the Julia fractals we're going to use for our noise.
+        """
+        alpha = 2.0 * math.pi * rand * self.rotation_max_value
+        scale = clamp(self.scale_value_high * rand, self.scale_value_low, self.scale_value_high)
+        trans = (rand * 2.0 - 1.0) * self.trans_max_value
+        zx = ((x * math.sin(alpha) + y * math.cos(alpha)) + trans) * scale
+        zy = ((x * math.cos(alpha) - y * math.sin(alpha)) + trans) * scale
+        return zx + zy * 1j
+
+    def make_complex(self, re1=None, re2=None, im1=None, im2=None):
+        """
+        This is a helper to create a complex number that might be random, depending on the given bounds given to it.
+        I use this function to create the different constant values that are added to Z in the julia function.
+        I found these default values to give the best results, since the julia set of c = 0 + 1j looks the morst like some mountain.
+        Also, it's way more predictable than anything else.
+        The bounds default to the constant_ values of the general control.
+        """
+        x = self.random.uniform(self.constant_re_low if re1 is None else re1, self.constant_re_high if re2 is None else re2)
+        y = self.random.uniform(self.constant_im_low if im1 is None else im1, self.constant_im_high if im2 is None else im2)
+        return x + y * 1j
+
+    def julia(self, z, c, limit=2.0):
+        """
+        This function iterates over a given position in the gaussian plan and returns the number of iterations needed to either :
+         - reach the maximum number of iterations allowed by max_it
+         - reach the limit, 2.0 by default but defined by our simplex noise for our island generation.
+        """
+        i = 0
+        for i in range(int(self.max_it)):
+            if abs(z) > limit:
+                break
+            z = z * z + c
+        return i
+
+    def fractal_transforms(self, zs_rand):
+        """
+        The rotation, scale and translation create_z applies for each random number of zs_rand, as a table of shape
+        (len(zs_rand), 4) holding sin(alpha), cos(alpha), the translation and the scale of each fractal.
+        The trigonometry is done once per fractal here, whatever the number of pixels.
+        """
+        table = np.empty((len(zs_rand), 4))
+        for i, rand in enumerate(zs_rand):
+            alpha = 2.0 * math.pi * rand * self.rotation_max_value
+            scale = clamp(self.scale_value_high * rand, self.scale_value_low, self.scale_value_high)
+            trans = (rand * 2.0 - 1.0) * self.trans_max_value
+            table[i] = math.sin(alpha), math.cos(alpha), trans, scale
+        return table
+
+    def transform_z_grid(self, zx, zy, transform):
+        """
+        Applies a row of the table of fractal_transforms to arrays of coordinates, the same way create_z does.
+        zx and zy only need to broadcast together : with a row of x coordinates and a column of y ones,
+        the products by sin(alpha) and cos(alpha) are only done once per column and once per row.
+        """
+        sin_alpha, cos_alpha, trans, scale = transform
+        re = zx * sin_alpha + zy * cos_alpha
+        re += trans
+        re *= scale
+        im = zx * cos_alpha - zy * sin_alpha
+        im += trans
+        im *= scale
+        z = np.empty(re.shape, dtype=np.complex128)
+        z.real = re
+        z.imag = im
+        return z
+
+    def julia_max(self, zx, zy, cs, zs_rand, limits=2.0, skip_saturated=True, periodicity=False, land=None):
+        """
+        Runs every fractal over the given coordinates and keeps the max iteration count of all of them for each point,
+        which is what update_julia does for a single pixel.
+        zx, zy and limits only need to broadcast together, see transform_z_grid.
+
+        With skip_saturated, the pixels that already got the highest count possible (max_it - 1) from a fractal
+        aren't given to the next ones, since their max can't grow anymore (as soon as there's 5% of them).
+        periodicity is passed to julia_grid.
+        land, if given, is a boolean mask of the shape of the output : the pixels out of it get 0 without running
+        any fractal (as soon as there's 5% of them). It's meant for the ocean when its limit is 0, so every fractal
+        escapes there on the first test (see julia_skips_ocean).
+        The work done is added to self.julia_counters.
+        """
+        shape = np.broadcast(zx, zy, limits).shape
+        size = int(np.prod(shape))
+        transforms = self.fractal_transforms(zs_rand)
+        saturated = max(int(self.max_it) - 1, 0)
+        counters = self.julia_counters
+
+        color = np.zeros(size, dtype=np.int32)
+        todo = np.arange(size)
+        if land is not None:
+            land = np.broadcast_to(land, shape)
+            if np.count_nonzero(land) < 0.95 * size:  # same as for the saturated pixels below
+                todo = np.flatnonzero(land)
+        culled = size - todo.size
+        flat = None
+        for c, transform in zip(cs, transforms):
+            counters.evaluations += size
+            counters.culled += culled
+            counters.skipped += size - culled - todo.size
+            if todo.size == 0:
+                continue
+            if todo.size == size:
+                z = self.transform_z_grid(zx, zy, transform)
+                v = julia_grid(z, c, limits, self.max_it, periodicity, counters=counters)
+                np.maximum(color, v.ravel(), out=color)
+            else:
+                if flat is None:
+                    flat = [np.broadcast_to(np.asarray(a, dtype=np.float64), shape).ravel() for a in (zx, zy, limits)]
+                z = self.transform_z_grid(flat[0][todo], flat[1][todo], transform)
+                v = julia_grid(z, c, flat[2][todo], self.max_it, periodicity, counters=counters)
+                color[todo] = np.maximum(color[todo], v)
+            if skip_saturated:
+                left = (color if todo.size == size else color[todo]) < saturated
+                # gathering the pixels left costs more than it saves when only a few are dropped
+                if np.count_nonzero(left) < 0.95 * todo.size:
+                    todo = todo[left]
+        return color.reshape(shape)
+
+    def julia_adaptive(self, zx, zy, cs, zs_rand, limits=2.0, min_size=8, land=None, check=False):
+        """
+        Same as julia_max over a 2D grid, but only computing the pixels it needs to (Mariani-Silver subdivision).
+
+        Starting from the whole grid, the border of each rectangle is computed. If the whole border has the same count,
+        the inside of the rectangle gets that count without being computed. Otherwise, it's cut in 4 rectangles sharing
+        their borders, and so on down to rectangles of min_size pixels on a side, which get computed whole.
+        The rectangles of each level are computed together, in a single call to julia_max.
+        A limit of 0 (the ocean) always gives 0 : a rectangle with only such limits inside is filled with 0 whatever
+        its border, and one with some of them inside (the coast) is never filled from its border, it's cut further.
+
+        That's exact for a plain julia set, whose regions of same count are connected, but here the limits come from
+        the noise, so a bump of the noise inside a rectangle can be missed. With check, the whole grid is computed too,
+        and the filled pixels that got the wrong count are added to self.julia_counters.mismatched (the adaptive
+        output is still the one returned).
+        The pixels asked for and the ones filled are added to self.julia_counters.
+        """
+        shape = np.broadcast(zx, zy, limits).shape
+        height, width = shape
+        flat = [np.broadcast_to(np.asarray(a, dtype=np.float64), shape).ravel() for a in (zx, zy, limits)]
+        flat_land = None if land is None else np.broadcast_to(land, shape).ravel()
+        counters = self.julia_counters
+
+        color = np.zeros(height * width, dtype=np.int32)
+        known = np.zeros(height * width, dtype=bool)
+        # summed area table of the pixels with a limit, to count them inside any rectangle at once
+        area = np.zeros((height + 1, width + 1), dtype=np.int64)
+        area[1:, 1:] = np.cumsum(np.cumsum(flat[2].reshape(shape) > 0, axis=0), axis=1)
+
+        def compute(pixels):
+            todo = np.zeros(height * width, dtype=bool)
+            todo[pixels] = True
+            pixels = np.flatnonzero(todo & ~known)
+            color[pixels] = self.julia_max(flat[0][pixels], flat[1][pixels], cs, zs_rand, flat[2][pixels],
+                                           land=None if flat_land is None else flat_land[pixels])
+            known[pixels] = True
+
+        def sides(y0, y1, x0, x1):
+            # the top, bottom, left and right sides of the borders of the rectangles, each rectangle after the other
+            # (a rectangle of a single row, like a band of one row, has no left and right sides under its top)
+            rows = np.maximum(y1 - y0 - 2, 0)
+            return [_ranges(y0 * width + x0, x1 - x0), _ranges((y1 - 1) * width + x0, x1 - x0),
+                    _ranges((y0 + 1) * width + x0, rows, width), _ranges((y0 + 1) * width + x1 - 1, rows, width)]
+
+        def inside(y0, y1, x0, x1):
+            # the pixels inside the borders of the rectangles, each rectangle after the other
+            rows = _ranges(y0 + 1, y1 - y0 - 2)
+            return _ranges(rows * width + np.repeat(x0 + 1, y1 - y0 - 2), np.repeat(x1 - x0 - 2, y1 - y0 - 2))
+
+        # the rectangles of a level, as arrays of their first and last (excluded) rows and columns
+        y0, y1, x0, x1 = (np.array([value]) for value in (0, height, 0, width))
+        while y0.size:
+            compute(np.concatenate(sides(y0, y1, x0, x1)))
+            keep = (y1 - y0 > 2) & (x1 - x0 > 2)  # the others have nothing inside their border
+            y0, y1, x0, x1 = y0[keep], y1[keep], x0[keep], x1[keep]
+            if not y0.size:
+                break
+
+            lowest, highest = None, None
+            for side, lengths in zip(sides(y0, y1, x0, x1), (x1 - x0, x1 - x0, y1 - y0 - 2, y1 - y0 - 2)):
+                starts = np.cumsum(lengths) - lengths
+                side_low, side_high = np.minimum.reduceat(color[side], starts), np.maximum.reduceat(color[side], starts)
+                lowest = side_low if lowest is None else np.minimum(lowest, side_low)
+                highest = side_high if highest is None else np.maximum(highest, side_high)
+            size = (y1 - y0 - 2) * (x1 - x0 - 2)
+            limited = area[y1 - 1, x1 - 1] - area[y0 + 1, x1 - 1] - area[y1 - 1, x0 + 1] + area[y0 + 1, x0 + 1]
+
+            fill = (limited == 0) | ((limited == size) & (lowest == highest))
+            pixels = inside(y0[fill], y1[fill], x0[fill], x1[fill])
+            values = np.repeat(np.where(limited == 0, 0, lowest)[fill], size[fill])
+            new = ~known[pixels]
+            counters.filled += int(np.count_nonzero(new))
+            color[pixels[new]] = values[new]
+            known[pixels] = True
+
+            smallest = ~fill & ((y1 - y0 <= min_size) | (x1 - x0 <= min_size))
+            compute(inside(y0[smallest], y1[smallest], x0[smallest], x1[smallest]))
+
+            cut = ~fill & ~smallest
+            y0, y1, x0, x1 = y0[cut], y1[cut], x0[cut], x1[cut]
+            ym, xm = (y0 + y1) // 2, (x0 + x1) // 2
+            y0, y1, x0, x1 = (np.concatenate([y0, y0, ym, ym]), np.concatenate([ym + 1, ym + 1, y1, y1]),
+                              np.concatenate([x0, xm, x0, xm]), np.concatenate([xm + 1, x1, xm + 1, x1]))
+        counters.pixels += height * width
+
+        color = color.reshape(shape)
+        if check:
+            self.julia_counters = JuliaCounters()  # the work of the check isn't the one of the adaptive evaluation
+            try:
+                exact = self.julia_max(zx, zy, cs, zs_rand, limits, land=land)
+            finally:
+                self.julia_counters = counters
+            counters.mismatched += int(np.count_nonzero(exact != color))
+        return color
+
+    def seed_julia(self):
+        """
+        This function is called before each update_julia to pick the constants and Z-seeds of the fractals.
+        """
+        self.cs = []
+        self.zs_rand = []
+
+        # lets populate our constant and Z-seeds
+        for i in range(self.num_frac):
+            self.cs.append(self.make_complex())
+            self.zs_rand.append(self.random.random())
+
+    def draw_randomness(self):
+        """
+        Draws every random value of an island, in the order generate uses them : the simplex offsets of the island
+        noise, the fractals (see seed_julia), then the simplex offsets of the salt noise.
+        Every renderer draws them with this, so they all get the same island as generate for the same seed.
+        Returns the island offsets, the fractals as (cs, zs_rand) and the salt offsets. The fractals stay in self.cs
+        and self.zs_rand, and the salt offsets in self.simplex_offsets.
+        """
+        self.seed_warp()
+        island_offsets = self.simplex_offsets
+        self.seed_julia()
+        self.seed_warp()
+        return island_offsets, (self.cs, self.zs_rand), self.simplex_offsets
+
+    def julia_rows(self, y_start, y_end, warp_data=None, rang=1):
+        """
+        Computes the julia data for the rows y_start to y_end (excluded) of the image, with the fractals picked by seed_julia.
+        warp_data, if given, only holds the noise of these rows.
+        Returns an array of shape (y_end - y_start, imgx).
+
+        With adaptive_julia, the rows are computed by julia_adaptive. Its rectangles start from the rows asked for,
+        so the renderers working band by band (stream.py, parallel.py) can then give slightly different data.
+        """
+        xa = -rang
+        xb = rang
+        ya = -rang
+        yb = rang
+
+        # a column of y coordinates and a row of x ones, that julia_max broadcasts to the whole grid
+        zy = np.arange(y_start, y_end, dtype=np.float64)[:, np.newaxis] * (yb - ya) / (self.imgy - 1) + ya
+        zx = np.arange(self.imgx, dtype=np.float64)[np.newaxis, :] * (xb - xa) / (self.imgx - 1) + xa
+        shape = (y_end - y_start, self.imgx)
+
+        limits = np.full(shape, 2.0)
+        land = None
+        if warp_data is not None:
+            limits = self.warp_to_julia_grid(np.asarray(warp_data, dtype=np.float64).reshape(shape))
+            if self.julia_skips_ocean():
+                land = self.land_rows(y_start, y_end)
+
+        if self.adaptive_julia:
+            return self.julia_adaptive(zx, zy, self.cs, self.zs_rand, limits, self.adaptive_julia, land=land)
+        return self.julia_max(zx, zy, self.cs, self.zs_rand, limits, land=land)
+
+    def update_julia(self, warp_data=None, rang=1, seed=True):
+        """
+        This is the main julia calculations function.
+
+        warp_data is where we put the noise to create our island with.
+        rang is juste the range of the output (by default from -1 - 1j to 1 + 1j).
+
+        The whole image is computed at once as arrays, see julia_grid.
+        Returns the iteration counts as an array of shape (imgy, imgx).
+        seed=False keeps the current fractals instead of drawing new ones.
+        """
+        if seed:
+            self.seed_julia()
+        print("Creating the Julia set data...")
+        with measure(self.instruments, "update_julia", self.imgx * self.imgy, self.julia_counters):
+            return self.julia_rows(0, self.imgy, warp_data, rang)
 
-def add_salt(data):
     """
-    This function gives you control over the data outputed by the update_julia function.
-    Basically the final changes before drawing it, in this state of the program.
+    Noise core
+    """
+
+    def fbm(self, vec, octaves=8, freq=5.0):
+        """
+        Simple wrapper for the function we're using from the noise library, or the same one of simplex.py without it.
+        """
+        if snoise2 is None:
+            return float(simplex.fbm2(vec[0] / freq, vec[1] / freq, octaves=octaves, base=self.origin))
+        return snoise2(vec[0] / freq, vec[1] / freq, octaves=octaves, base=self.origin)
+
+    def warp(self, p, freq=5.0):
+        """
+        This is the core warp function, gotten from Inigo Quilez ( <3 )
+
+        It takes a position (as a Vector2, or a Vector of vector.py) on entry, and makes its vectors of the same type.
+        Returns a float value between -1 and 1.
+        The more warping, the closer to 0 the value will get, so scale it up before writing it to an image.
+        """
+        vector = type(p)
+        updated_value = vector(0, 0)
+        for i in range(self.num_warpings):
+            off1 = self.simplex_offsets[2 * i]
+            off2 = self.simplex_offsets[2 * i + 1]
+            updated_value = vector(self.fbm(p + updated_value * 4.0 + vector(off1[0], off1[1]), freq=freq),
+                                   self.fbm(p + updated_value * 4.0 + vector(off2[0], off2[1]), freq=freq))
+        return self.fbm(p + updated_value * 4.0, freq=freq)
+
+    def fbm_grid(self, xs, ys, octaves=8, freq=5.0):
+        """
+        Same as fbm, but for whole arrays of coordinates, with the backend of noise_backend (see noise_backends).
+        """
+        xs = np.asarray(xs, dtype=np.float64) / freq
+        ys = np.asarray(ys, dtype=np.float64) / freq
+        if self.noise_backend not in noise_backends:
+            raise ValueError("Unknown noise backend: {0}".format(self.noise_backend))
+        return noise_backends[self.noise_backend](xs, ys, octaves, self.origin)
+
+    def warp_grid(self, px, py, freq=5.0, octaves=8):
+        """
+        Same as warp, but for whole arrays of positions, px being the x coordinates and py the y ones.
+        The operations are done in the same order as in warp, so the noise gets the exact same inputs.
+        octaves is passed to fbm_grid, fewer of them being faster but less detailed.
+        """
+        ux = np.zeros(np.shape(px))
+        uy = np.zeros(np.shape(py))
+        for i in range(self.num_warpings):
+            off1 = self.simplex_offsets[2 * i]
+            off2 = self.simplex_offsets[2 * i + 1]
+            ux, uy = (self.fbm_grid(px + ux * 4.0 + off1[0], py + uy * 4.0 + off1[1], octaves, freq),
+                      self.fbm_grid(px + ux * 4.0 + off2[0], py + uy * 4.0 + off2[1], octaves, freq))
+        return self.fbm_grid(px + ux * 4.0, py + uy * 4.0, octaves, freq)
+
+    def seed_warp(self):
+        """
+        This function is called between each update_warp to have some random simplex positions and create different noise each time.
+        """
+        self.simplex_offsets = []
+        for i in range(2 * self.num_warpings):
+            self.simplex_offsets.append((self.random.uniform(-10000, 10000), self.random.uniform(-10000, 10000)))
+
+    def transform_warp(self, x, y, simplex):
+        """
+        This function gives you control over the noise you're going to feed to the Julia set for it's limits.
+        It's inputed with the simplex value for the position(x, y)
+
+        What I've done here is giving it a factor that depends on the distance to the center of given point (x, y).
+        So basically, making the noise 0 at the edge of the island and island_height at the center of it.
+        """
+        dist_center = math.sqrt((x - self.imgx / 2) ** 2 + (y - self.imgy / 2) ** 2) / (self.imgx / 2)
+        island_radius = (dist_center + self.radius_offset)
+        factor = 1 - (island_radius ** 2)
+        if island_radius > 1:
+            factor = 0
+        simplex *= factor
+
+        return simplex
+
+    def transform_warp_grid(self, x, y, simplex):
+        """
+        Same as transform_warp, for whole arrays of pixel positions and simplex values.
+        """
+        dist_center = np.sqrt((x - self.imgx / 2) ** 2 + (y - self.imgy / 2) ** 2) / (self.imgx / 2)
+        island_radius = (dist_center + self.radius_offset)
+        factor = np.where(island_radius > 1, 0.0, 1 - (island_radius ** 2))
+        return simplex * factor
+
+    def land_grid(self, x, y):
+        """
+        Whether the pixels at the positions (x, y) are in the footprint of the island, where transform_warp_grid
+        doesn't zero the noise. Everything out of it is ocean whatever the seed : 0 in the warped noise of the island
+        and of the salt, so a limit of warp_to_julia_grid(0) in the julia data (see julia_skips_ocean).
+        All True when cull_ocean is off, so every pixel gets computed.
+        """
+        if not self.cull_ocean:
+            return np.ones(np.broadcast(x, y).shape, dtype=bool)
+        dist_center = np.sqrt((x - self.imgx / 2) ** 2 + (y - self.imgy / 2) ** 2) / (self.imgx / 2)
+        island_radius = (dist_center + self.radius_offset)
+        return ~(island_radius > 1)
+
+    def julia_skips_ocean(self):
+        """
+        Whether the julia data can skip the ocean out of land_grid, as a count of 0 without running the fractals.
+        Its limit is warp_to_julia_grid(0), which is only 0 when noise_sharpness is over 0 : with a noise_sharpness
+        of 0, it's 2 like on the land, and the fractals have to run there too.
+        """
+        return self.cull_ocean and self.warp_to_julia_grid(0.0) == 0
+
+    def land_spans(self):
+        """
+        The footprint of the island (see land_grid) as a span of columns [start, end) for each row of the image,
+        in an int array of shape (imgy, 2). It's a disc, so the land of a row is always in one piece.
+        Only depends on imgx, imgy, radius_offset and cull_ocean, and is kept until one of them changes.
+        """
+        key = (self.imgx, self.imgy, self.radius_offset, self.cull_ocean)
+        if self._land_spans is None or self._land_spans[0] != key:
+            spans = np.zeros((self.imgy, 2), dtype=np.int64)
+            x = np.arange(self.imgx, dtype=np.float64)
+            for y_start in range(0, self.imgy, 256):
+                y = np.arange(y_start, min(y_start + 256, self.imgy), dtype=np.float64)
+                land = self.land_grid(x[np.newaxis, :], y[:, np.newaxis])
+                width = np.count_nonzero(land, axis=1)
+                spans[y_start:y_start + len(y), 0] = np.where(width > 0, np.argmax(land, axis=1), 0)
+                spans[y_start:y_start + len(y), 1] = spans[y_start:y_start + len(y), 0] + width
+            self._land_spans = (key, spans)
+        return self._land_spans[1]
+
+    def land_rows(self, y_start, y_end):
+        """
+        The footprint of the island for the rows y_start to y_end (excluded), as a boolean array of shape
+        (y_end - y_start, imgx).
+        """
+        spans = self.land_spans()[y_start:y_end]
+        x = np.arange(self.imgx)
+        return (x >= spans[:, :1]) & (x < spans[:, 1:])
+
+    def warp_to_julia(self, warp_value):
+        """
+        This function converts the float value of the warped noise at some point (x, y) (so between -1 and 1) to return a float.
+        The returned value will be used by the julia function as it's limit.
+
+        You can play with this function a bit to see how it changes the island.
+        Try to keep the return value positive though.
+        """
+        return 2.0 * math.fabs(warp_value) ** self.noise_sharpness  # more flat (don't try on your girlfriend)
+
+    def warp_to_julia_grid(self, warp_values):
+        """
+        Same as warp_to_julia, for a whole array of warped noise values.
+        """
+        return 2.0 * np.abs(warp_values) ** self.noise_sharpness
+
+    def warp_rows(self, y_start, y_end, freq=5.0, mask=None):
+        """
+        Computes the transformed warped noise for the rows y_start to y_end (excluded) of the image.
+        Returns a float32 array of shape (y_end - y_start, imgx).
+
+        The noise is only computed on the land (see land_rows), the ocean being 0 anyway.
+        mask, a boolean array of the same shape, can skip more pixels when cull_ocean is on, which are then 0 too.
+        """
+        x = np.arange(self.imgx, dtype=np.float64)
+        y = np.arange(y_start, y_end, dtype=np.float64)
+        x, y = np.meshgrid(x, y)
+        land = self.land_rows(y_start, y_end)
+        if mask is not None and self.cull_ocean:
+            land &= mask
+        warp = np.zeros(x.shape, dtype=np.float32)
+        x, y = x[land], y[land]
+        simplex = self.warp_grid(x / self.imgx, y / self.imgy, freq=freq)
+        warp[land] = self.transform_warp_grid(x, y, simplex)
+        return warp
+
+    def update_warp(self, freq=5.0, block_rows=64, seed=True, mask=None):
+        """
+        This is the function calculating our base warped noise.
+
+        It gets the value from the core warp function, lets you modify it as you wish, and return all of the values for the image.
+        The image is computed by blocks of block_rows rows, and returned as a float32 array of shape (imgy, imgx).
+
+        The noise itself is only float32 precision in the noise library, so the only difference with the per-pixel
+        warp and transform_warp functions is the final rounding of the falloff to float32 (less than 1e-7 away).
+
+        seed=False keeps the current simplex offsets instead of drawing new ones.
+        mask, a boolean array of shape (imgy, imgx), is passed to warp_rows : the pixels out of it are left to 0.
+        """
+        data_warp = np.empty((self.imgy, self.imgx), dtype=np.float32)
+        if seed:
+            self.seed_warp()
+        print("Creating some warped noise...")
+        with measure(self.instruments, "update_warp", self.imgx * self.imgy):
+            for y in range(0, self.imgy, block_rows):
+                y_end = min(y + block_rows, self.imgy)
+                data_warp[y:y_end] = self.warp_rows(y, y_end, freq=freq, mask=None if mask is None else mask[y:y_end])
+        return data_warp
 
-    What I do here is add a little more salt, in the form of a ponderated average on some levels with another set of warped noise.
     """
-    salt = update_warp(freq=salt_frequency)
-    salt = scale_list(salt, 255.0)
+    Scaling
+    """
+
+    def top(self, stage, freq=None):
+        """
+        The value the output of a stage ("warp" or "julia") is scaled by with scale_list, or None for its own max.
+
+        In "image" normalization it's always None, so the scaling needs the whole image.
+        In "bounded" normalization it's known before generating anything, so bands, tiles and chunks all get the
+        same scaling as the whole image :
+         - the julia data can't go over max_it - 1,
+         - the warped noise (of frequency freq, with the current simplex offsets) is estimated by noise_top.
+        """
+        if self.normalization == "image":
+            return None
+        if self.normalization != "bounded":
+            raise ValueError("Unknown normalization: {0}".format(self.normalization))
+        if stage == "julia":
+            return max(int(self.max_it) - 1, 1)
+        return self.noise_top(freq)
+
+    def noise_top(self, freq=5.0):
+        """
+        Estimates the max of the transformed warped noise over the whole image, from a low resolution pass of
+        noise_estimate_resolution x noise_estimate_resolution pixels spread over it.
+        It only depends on the seed and the general control, not on the part of the image being generated.
+        """
+        x = np.linspace(0, self.imgx - 1, self.noise_estimate_resolution)
+        y = np.linspace(0, self.imgy - 1, self.noise_estimate_resolution)
+        x, y = np.meshgrid(x, y)
+        simplex = self.warp_grid(x / self.imgx, y / self.imgy, freq=freq)
+        return float(self.transform_warp_grid(x, y, simplex).astype(np.float32).max())
 
-    final = []
-    for i, d in enumerate(data):
-        if d > low_barrier:
-            # we add the salt noise proportionally to the mountain height (the lower, the more salt)
-            final.append((weight_base * d + weight_salt * (salt[i] * (255.0 / (2.0*(2.0 * 255.0 + d))))) / (weight_base + weight_salt))
-        else:
-            final.append(0)
+    """
+    Final changes
+    """
 
-    return final
+    def add_salt(self, data, seed=True):
+        """
+        This function gives you control over the data outputed by the update_julia function.
+        Basically the final changes before drawing it, in this state of the program.
+
+        What I do here is add a little more salt, in the form of a ponderated average on some levels with another set of warped noise.
+        Its measure holds the update_warp of the salt noise, which is measured on its own too.
+
+        mix_salt only keeps the salt where data is over low_barrier. In "bounded" normalization, the scaling of the
+        salt doesn't need the rest of it, so the salt noise is only computed there.
+        seed=False keeps the current simplex offsets instead of drawing new ones.
+        """
+        with measure(self.instruments, "add_salt", self.imgx * self.imgy):
+            if seed:
+                self.seed_warp()
+            salt_top = self.top("warp", self.salt_frequency)
+            mask = None if salt_top is None else np.asarray(data) > self.low_barrier
+            salt = self.update_warp(freq=self.salt_frequency, seed=False, mask=mask)
+            return self.mix_salt(data, salt, salt_top)
+
+    def mix_salt(self, data, salt, salt_top=None):
+        """
+        The ponderated average of add_salt, with salt being the raw warped noise.
+        salt_top is passed to scale_list for the salt.
+        """
+        salt = scale_list(salt, 255.0, salt_top)
+
+        data = np.asarray(data, dtype=np.float64)
+        weight_base, weight_salt = self.weight_base, self.weight_salt
+        # we add the salt noise proportionally to the mountain height (the lower, the more salt)
+        final = (weight_base * data + weight_salt * (salt * (255.0 / (2.0*(2.0 * 255.0 + data))))) / (weight_base + weight_salt)
+        final = np.where(data > self.low_barrier, final, 0.0)
+
+        return final
+
+    def erosion_params(self):
+        """
+        The parameters of erosion.ErosionState.step, from the values of the general control.
+        """
+        return {name: getattr(self, "erosion_" + name)
+                for name in ("rain", "capacity", "rate", "deposition", "evaporation", "talus", "thermal")}
+
+    def erode(self, data, gradients):
+        """
+        Erodes the heightmap of add_salt (see erosion.py) for erosion_iterations iterations, or until it goes over
+        erosion_seconds. The cost of each iteration is kept in self.erosion_report.
+        The erosion keeps the gradients up to date as it goes, so the normals come from them instead of the heights.
+        Returns the eroded heightmap, its normals and its gradients.
+        """
+        print("Eroding...")
+        self.erosion_report = erosion.ErosionReport(self.imgx * self.imgy)
+        with measure(self.instruments, "erode", self.imgx * self.imgy):
+            data, gradients = erosion.erode(data, gradients, self.erosion_iterations, self.erosion_seconds,
+                                            self.erosion_report, **self.erosion_params())
+            normals = erosion.normals_from_gradients(gradients)
+        print(self.erosion_report.report())
+        return data, normals, gradients
+
+    def generate(self):
+        """
+        Runs the whole pipeline and returns the final heightmap, its normals and its gradients.
+        """
+        island_offsets, _, salt_offsets = self.draw_randomness()
+
+        # We first make a domain warped noise image that we (badly) scale up to a (-1, 1) range.
+        self.simplex_offsets = island_offsets
+        data = self.update_warp(freq=self.island_noise_frequency, seed=False)
+        data = scale_list(data, 1.0, self.top("warp", self.island_noise_frequency))  # not perfect since there are negative values in data
+        # draw(data, filename="noise.png")  # if we want to have a look at our warped noise
+
+        # We then feed that data to the julia set
+        data = self.update_julia(data, seed=False)
+        data = scale_list(data, 255.0, self.top("julia"))
+        # draw(self.update_julia(), filename="julia.png")  # if we want to take a look at some fractals without noise
+
+        self.simplex_offsets = salt_offsets
+        data = self.add_salt(data, seed=False)
+
+        normals = create_normals(data, instruments=self.instruments)
+        print("Creating gradients...")
+        gradients = create_gradient_from_normals(normals, self.instruments)
+        if self.erosion_iterations > 0:
+            data, normals, gradients = self.erode(data, gradients)
+        return data, normals, gradients
 
 
 """
@@ -401,41 +1155,55 @@ def add_salt(data):
 """
 
 
-"""
-Initialize some general value and the randomness.
-
-The values origin and the ones in the list simplex_offsets are used for the different simplex noises we're going to generate for the domain warping.
-They need to be consistent throughout each warping process.
-"""
-
-random.seed()
-origin = random.uniform(-10000, 10000)
-simplex_offsets = []
-image = Image.new("RGB", (imgx, imgy))
-
-data_xy = []
-for y in range(imgy):
-    for x in range(imgx):
-        data_xy.append((x, y))
-
-
-# We first make a domain warped noise image that we (badly) scale up to a (-1, 1) range.
-data = update_warp(freq=island_noise_frequency)
-data = scale_list(data, 1.0)  # not perfect since there are negative values in data
-# draw(data, filename="noise.png")  # if we want to have a look at our warped noise
-
-# We then feed that data to the julia set
-data = update_julia(data)
-data = scale_list(data, 255.0)
-# draw(update_julia(), filename="julia.png")  # if we want to take a look at some fractals without noise
+def parse_control(text):
+    """
+    Parses a "name=value" argument of the command line into a value of the general control, of the type of its default.
+    """
+    name, _, value = text.partition("=")
+    if name not in control_names:
+        raise argparse.ArgumentTypeError("Unknown control value: {0}".format(name))
+    return name, type(globals()[name])(value)
 
-data = add_salt(data)
-draw(data)
 
-normals = create_normals(data)
-draw_from_vectors(normals)
-gradients = create_gradient_from_normals(normals)
-draw_from_vectors(gradients, filename="island_gradients.png")
+def main(args=None):
+    """
+    The command line : generates an island and saves its heightmap, normals and gradients in the images directory.
+    """
+    parser = argparse.ArgumentParser(description="Island heightmap generator using Julia set and Simplex noise.")
+    parser.add_argument("--seed", type=int, default=None, help="seed of the island, random by default")
+    parser.add_argument("--size", type=int, default=None, help="width and height of the image (imgx and imgy)")
+    parser.add_argument("--set", type=parse_control, action="append", default=[], metavar="NAME=VALUE",
+                        help="changes a value of the general control, like --set max_it=32")
+    parser.add_argument("--log-stages", action="store_true", help="logs the measures of each stage")
+    parser.add_argument("--stages-json", default=None, metavar="FILE",
+                        help="appends the measures of each stage to FILE, as lines of JSON")
+    args = parser.parse_args(args)
+
+    control = dict(args.set)
+    if args.size is not None:
+        control["imgx"] = control["imgy"] = args.size
+
+    instruments = None
+    if args.log_stages or args.stages_json:
+        import logging
+        from instruments import Instruments, JsonSink, LogSink
+        sinks = []
+        if args.log_stages:
+            logging.basicConfig(level=logging.INFO, format="%(message)s")
+            sinks.append(LogSink())
+        if args.stages_json:
+            sinks.append(JsonSink(args.stages_json))
+        instruments = Instruments(*sinks)
+
+    data, normals, gradients = IslandGenerator(args.seed, instruments, **control).generate()
+    with ImageWriter(instruments=instruments) as writer:
+        writer.draw(data)
+        writer.draw_from_vectors(normals)
+        writer.draw_from_vectors(gradients, filename="island_gradients.png")
+
+
+if __name__ == "__main__":
+    main()
 
 
 
@@ -0,0 +1,173 @@
+"""
+Mip pyramids of the heightmap and of the normals, in a tiled file that can be read a tile at a time.
+
+Each level of a pyramid is half the size of the one before it (rounded up), down to a single pixel :
+ - a pixel of the heightmap is the average of the 2x2 pixels under it, in float32, so nothing is lost to
+   8 bits images on the way,
+ - a normal is the average of the 2x2 normals under it, normalized again.
+When a level has an odd size, its last row or column is repeated to make the 2x2 blocks.
+
+The file holds several layers (the heightmap and the normals), each one being a pyramid cut in square tiles.
+It starts with 8 magic bytes and the position of its index (a little-endian uint64). The index, at the end of the
+file, is JSON : for each layer its dtype, its number of channels and its levels, each with its size and the position
+and size of each of its tiles (row by row). Tiles are raw little-endian values, compressed with zlib or not.
+MipmapReader reads any tile of any level without reading the rest of the file.
+
+Usage : python mipmap.py [--seed 42] [--size 1024] [--tile-size 256] [--name images/island.mip]
+"""
+
+import argparse
+import json
+import struct
+import zlib
+
+import numpy as np
+
+import main
+
+
+magic = b"ISLMIP1\0"
+
+
+def _halve(level):
+    """
+    Averages each 2x2 block of pixels of level (of shape (height, width) or (height, width, channels)).
+    """
+    height, width = level.shape[:2]
+    if height % 2 or width % 2:
+        pad = [(0, height % 2), (0, width % 2)] + [(0, 0)] * (level.ndim - 2)
+        level = np.pad(level, pad, mode="edge")
+    return (level[0::2, 0::2] + level[1::2, 0::2] + level[0::2, 1::2] + level[1::2, 1::2]) * 0.25
+
+
+def heights_pyramid(data):
+    """
+    The mip pyramid of a heightmap : a list of float32 arrays, from the heightmap itself down to a single pixel.
+    """
+    levels = [np.asarray(data, dtype=np.float32)]
+    while max(levels[-1].shape) > 1:
+        levels.append(_halve(levels[-1].astype(np.float64)).astype(np.float32))
+    return levels
+
+
+def normals_pyramid(normals):
+    """
+    The mip pyramid of normals of shape (height, width, 3), as a list of float32 arrays.
+    """
+    levels = [np.asarray(normals, dtype=np.float32)]
+    while max(levels[-1].shape[:2]) > 1:
+        level = _halve(levels[-1].astype(np.float64))
+        norm = np.sqrt(np.sum(level * level, axis=-1, keepdims=True))
+        norm[norm == 0] = 1.0
+        levels.append((level / norm).astype(np.float32))
+    return levels
+
+
+def write_mipmaps(filename, layers, tile_size=256, compress=True):
+    """
+    Writes pyramids to a tiled file. layers is a dict of pyramids by name, like
+        {"heights": heights_pyramid(data), "normals": normals_pyramid(normals)}
+    """
+    index = {"tile_size": tile_size, "compression": "zlib" if compress else None, "layers": {}}
+    with open(filename, "wb") as f:
+        f.write(magic)
+        f.write(struct.pack("<Q", 0))  # position of the index, written at the end
+        for name, pyramid in layers.items():
+            first = pyramid[0]
+            layer = {"dtype": "<f4", "channels": first.shape[2] if first.ndim == 3 else 1, "levels": []}
+            for level in pyramid:
+                height, width = level.shape[:2]
+                tiles = []
+                for y in range(0, height, tile_size):
+                    for x in range(0, width, tile_size):
+                        content = np.ascontiguousarray(level[y:y + tile_size, x:x + tile_size], dtype="<f4").tobytes()
+                        if compress:
+                            content = zlib.compress(content, 6)
+                        tiles.append([f.tell(), len(content)])
+                        f.write(content)
+                layer["levels"].append({"width": width, "height": height, "tiles": tiles})
+            index["layers"][name] = layer
+
+        position = f.tell()
+        f.write(json.dumps(index).encode("utf-8"))
+        f.seek(len(magic))
+        f.write(struct.pack("<Q", position))
+    print("Saved mipmaps as {0}.".format(filename))
+
+
+class MipmapReader(object):
+    """
+    Reads the tiles of a file written by write_mipmaps, only reading the index when opened.
+    """
+    def __init__(self, filename):
+        self.file = open(filename, "rb")
+        if self.file.read(len(magic)) != magic:
+            self.file.close()
+            raise ValueError("{0} is not a mipmaps file".format(filename))
+        position = struct.unpack("<Q", self.file.read(8))[0]
+        self.file.seek(position)
+        index = json.loads(self.file.read().decode("utf-8"))
+        self.tile_size = index["tile_size"]
+        self.compression = index["compression"]
+        self.layers = index["layers"]
+
+    def levels(self, layer):
+        """
+        The number of levels of a layer.
+        """
+        return len(self.layers[layer]["levels"])
+
+    def tile(self, layer, level, tile_x, tile_y):
+        """
+        The tile (tile_x, tile_y) of a level of a layer, level 0 being the full resolution.
+        Tiles on the right and bottom borders can be smaller than tile_size.
+        """
+        info = self.layers[layer]
+        size = info["levels"][level]
+        columns = -(-size["width"] // self.tile_size)
+        offset, length = size["tiles"][tile_y * columns + tile_x]
+        self.file.seek(offset)
+        content = self.file.read(length)
+        if self.compression == "zlib":
+            content = zlib.decompress(content)
+
+        height = min(self.tile_size, size["height"] - tile_y * self.tile_size)
+        width = min(self.tile_size, size["width"] - tile_x * self.tile_size)
+        shape = (height, width) if info["channels"] == 1 else (height, width, info["channels"])
+        return np.frombuffer(content, dtype=info["dtype"]).reshape(shape)
+
+    def level(self, layer, level):
+        """
+        A whole level of a layer, put together from its tiles.
+        """
+        info = self.layers[layer]
+        size = info["levels"][level]
+        rows = []
+        for tile_y in range(-(-size["height"] // self.tile_size)):
+            rows.append(np.concatenate([self.tile(layer, level, tile_x, tile_y)
+                                        for tile_x in range(-(-size["width"] // self.tile_size))], axis=1))
+        return np.concatenate(rows, axis=0)
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generates an island and saves the mipmaps of its heightmap and normals.")
+    parser.add_argument("--seed", type=int, default=None, help="seed of the island, random by default")
+    parser.add_argument("--size", type=int, default=None, help="width and height of the image (imgx and imgy)")
+    parser.add_argument("--tile-size", type=int, default=256, help="width and height of a tile")
+    parser.add_argument("--no-compression", action="store_true", help="store the tiles without compressing them")
+    parser.add_argument("--name", default="images/island.mip", help="path of the file")
+    args = parser.parse_args()
+
+    control = {} if args.size is None else {"imgx": args.size, "imgy": args.size}
+    data, normals, gradients = main.IslandGenerator(args.seed, **control).generate()
+    write_mipmaps(args.name, {"heights": heights_pyramid(data), "normals": normals_pyramid(normals)},
+                  args.tile_size, not args.no_compression)
@@ -0,0 +1,278 @@
+"""
+Multi-core rendering of the island.
+
+The image is cut in bands of rows that are sent to a pool of processes.
+Everything random (origin, the simplex offsets of both warps, the constants and Z-seeds of the fractals) is drawn
+in the main process by the draw_randomness of the generator, like its generate does, and sent to each worker once when
+the pool starts.
+The inputs and outputs of each stage live in shared memory, so the only things going through the pool are row numbers.
+
+The scalings (scale_list) are done in the main process between the stages, since in "image" normalization they
+need the whole image. This gives the exact same output as IslandGenerator.generate for the same seed, except with
+adaptive_julia : its rectangles start from the bands instead of the whole image (see IslandGenerator.julia_rows).
+
+The erosion (when erosion_iterations isn't 0) is cut in square tiles instead of bands, see erode.
+
+Usage : python parallel.py [--seed 42] [--workers 8] [--band-rows 32] [--tile-size 256]
+"""
+
+import argparse
+import contextlib
+import os
+import time
+from multiprocessing import Pool, resource_tracker, shared_memory
+
+import numpy as np
+
+import erosion
+import main
+
+
+def _shared_array(shape, dtype):
+    """
+    Creates an array living in a new block of shared memory. Returns the block and the array.
+    """
+    size = max(int(np.prod(shape)) * np.dtype(dtype).itemsize, 1)
+    block = shared_memory.SharedMemory(create=True, size=size)
+    return block, np.ndarray(shape, dtype=dtype, buffer=block.buf)
+
+
+class _Attached(object):
+    """
+    Opens a block of shared memory made by _shared_array in a worker, as an array.
+    """
+    def __init__(self, name, shape, dtype):
+        self.block = shared_memory.SharedMemory(name=name)
+        self.array = np.ndarray(shape, dtype=dtype, buffer=self.block.buf)
+
+    def __enter__(self):
+        return self.array
+
+    def __exit__(self, *args):
+        del self.array
+        self.block.close()
+
+
+def _init_worker(state):
+    """
+    Called once in each worker when the pool starts, to get the same state as the main process.
+    """
+    global _generator, _offsets
+    _generator = main.IslandGenerator(**state["control"])
+    _generator.origin = state["origin"]
+    _generator.cs = state["cs"]
+    _generator.zs_rand = state["zs_rand"]
+    _generator.cull_ocean = state["cull_ocean"]
+    _offsets = state["offsets"]
+
+
+def _warp_band(task):
+    """
+    Computes rows of a warp into the shared output.
+    """
+    out, y_start, y_end, freq, offsets = task
+    _generator.simplex_offsets = _offsets[offsets]
+    with _Attached(*out) as array:
+        array[y_start:y_end] = _generator.warp_rows(y_start, y_end, freq=freq)
+
+
+def _julia_band(task):
+    """
+    Computes rows of the julia data into the shared output, from the shared (scaled) warp data.
+    """
+    out, warp, y_start, y_end = task
+    with _Attached(*warp) as warp_data, _Attached(*out) as array:
+        array[y_start:y_end] = _generator.julia_rows(y_start, y_end, warp_data[y_start:y_end])
+
+
+def _normals_band(task):
+    """
+    Computes rows of normals into the shared output, from the shared heightmap.
+    """
+    out, heights, y_start, y_end = task
+    with _Attached(*heights) as values, _Attached(*out) as array:
+        array[y_start:y_end] = main.create_normals(values, y_start, y_end)
+
+
+@contextlib.contextmanager
+def _shared_arrays():
+    """
+    Gives a function shared(shape, dtype) making arrays in shared memory, as (reference for the workers, array).
+    The blocks are freed when the with block ends.
+    """
+    blocks = []
+
+    def shared(shape, dtype):
+        block, array = _shared_array(shape, dtype)
+        blocks.append(block)
+        return (block.name, shape, dtype), array
+
+    # The workers must share the resource tracker of the main process, or theirs would delete the blocks when they exit
+    resource_tracker.ensure_running()
+    try:
+        yield shared
+    finally:
+        for block in blocks:
+            block.unlink()
+            try:
+                block.close()
+            except BufferError:
+                pass  # still referenced by a traceback, it's freed with it
+
+
+"""
+What the erosion goes through from an iteration to the next, apart from the ocean (see erosion.ErosionState).
+"""
+erosion_arrays = ["heights", "water", "sediment", "gx", "gy"]
+
+
+def _erosion_tile(task):
+    """
+    Runs iterations of the erosion on a tile and its halo, from the shared state of the map before them,
+    and writes the tile into the shared state after them.
+    """
+    before, after, ocean, (y_start, y_end, x_start, x_end), halo, iterations, params = task
+    with contextlib.ExitStack() as stack:
+        sources = [stack.enter_context(_Attached(*before[name])) for name in erosion_arrays]
+        targets = [stack.enter_context(_Attached(*after[name])) for name in erosion_arrays]
+        ocean = stack.enter_context(_Attached(*ocean))
+        height, width = ocean.shape
+        window = (slice(max(y_start - halo, 0), min(y_end + halo, height)),
+                  slice(max(x_start - halo, 0), min(x_end + halo, width)))
+        state = erosion.ErosionState(*[source[window].copy() for source in sources], ocean[window].copy())
+        for iteration in range(iterations):
+            state.step(**params)
+        tile = (slice(y_start - window[0].start, y_end - window[0].start),
+                slice(x_start - window[1].start, x_end - window[1].start))
+        for name, target in zip(erosion_arrays, targets):
+            target[y_start:y_end, x_start:x_end] = getattr(state, name)[tile]
+
+
+def erode(generator, data, gradients, workers=None, tile_size=256, exchange=4):
+    """
+    Same as generator.erode(data, gradients), with the map cut in tiles of tile_size x tile_size pixels computed by
+    a pool of workers processes.
+    A pixel only depends on the pixels at most 3 pixels away at the iteration before, so each tile is computed with a
+    halo of 3 * exchange pixels around it for exchange iterations at once. Then the tiles exchange their halos
+    through the shared state of the whole map, and so on. This gives the exact same output as generator.erode.
+    Returns the eroded heightmap, its normals and its gradients.
+    """
+    print("Eroding...")
+    height, width = np.shape(data)
+    report = generator.erosion_report = erosion.ErosionReport(height * width)
+    first = erosion.ErosionState.start(data, gradients)
+    tiles = [(y, min(y + tile_size, height), x, min(x + tile_size, width))
+             for y in range(0, height, tile_size) for x in range(0, width, tile_size)]
+
+    with _shared_arrays() as shared, Pool(workers) as pool, main.measure(generator.instruments, "erode", height * width):
+        states = []
+        for copy in range(2):
+            references, arrays = {}, {}
+            for name in erosion_arrays:
+                references[name], arrays[name] = shared((height, width), np.float64)
+            states.append((references, arrays))
+        for name in erosion_arrays:
+            states[0][1][name][:] = getattr(first, name)
+        ocean, ocean_array = shared((height, width), bool)
+        ocean_array[:] = first.ocean
+
+        done = 0
+        start = time.perf_counter()
+        while done < generator.erosion_iterations:
+            if generator.erosion_seconds and done and time.perf_counter() - start > generator.erosion_seconds:
+                report.budget_reached = True
+                break
+            iterations = min(exchange, generator.erosion_iterations - done)
+            before = time.perf_counter()
+            tasks = [(states[0][0], states[1][0], ocean, tile, 3 * iterations, iterations, generator.erosion_params())
+                     for tile in tiles]
+            pool.map(_erosion_tile, tasks, chunksize=1)
+            report.add(time.perf_counter() - before, iterations)
+            states.reverse()
+            done += iterations
+
+        arrays = states[0][1]
+        last = erosion.ErosionState(*[arrays[name].copy() for name in erosion_arrays], first.ocean)
+        gradients = last.gradients()
+        normals = erosion.normals_from_gradients(gradients)
+    print(report.report())
+    return last.heights, normals, gradients
+
+
+def _bands(height, band_rows):
+    return [(y, min(y + band_rows, height)) for y in range(0, height, band_rows)]
+
+
+def _render_stages(generator, pool, shared, bands, tops):
+    """
+    The stages of IslandGenerator.generate, band by band. shared(shape, dtype) makes the shared arrays.
+    tops are the values to scale the island noise, the julia data and the salt noise by (see IslandGenerator.top).
+    Returns the final heightmap and the normals, copied out of shared memory.
+    """
+    shape = (generator.imgy, generator.imgx)
+
+    print("Creating some warped noise...")
+    warp_ref, warp = shared(shape, np.float32)
+    salt_ref, salt = shared(shape, np.float32)
+    tasks = [(warp_ref, y0, y1, generator.island_noise_frequency, "island") for y0, y1 in bands]
+    tasks += [(salt_ref, y0, y1, generator.salt_frequency, "salt") for y0, y1 in bands]
+    pool.map(_warp_band, tasks, chunksize=1)
+
+    scaled_ref, scaled = shared(shape, warp.dtype)
+    scaled[:] = main.scale_list(warp, 1.0, tops["island"])
+
+    print("Creating the Julia set data...")
+    julia_ref, julia = shared(shape, np.int32)
+    pool.map(_julia_band, [(julia_ref, scaled_ref, y0, y1) for y0, y1 in bands], chunksize=1)
+
+    data = generator.mix_salt(main.scale_list(julia, 255.0, tops["julia"]), salt, tops["salt"])
+    heights_ref, heights = shared(shape, data.dtype)
+    heights[:] = data
+
+    print("Creating normals...")
+    normals_ref, normals = shared(shape + (3,), np.float32)
+    pool.map(_normals_band, [(normals_ref, heights_ref, y0, y1) for y0, y1 in bands], chunksize=1)
+    return data, normals.copy()
+
+
+def render(generator, workers=None, band_rows=32, tile_size=256):
+    """
+    Same as generator.generate(), but using a pool of workers processes (one per core by default).
+    tile_size is the size of the tiles of the erosion.
+    Returns the final heightmap, its normals and its gradients.
+    """
+    island_offsets, _, salt_offsets = generator.draw_randomness()
+    tops = {"salt": generator.top("warp", generator.salt_frequency), "julia": generator.top("julia")}
+    generator.simplex_offsets = island_offsets
+    tops["island"] = generator.top("warp", generator.island_noise_frequency)
+    generator.simplex_offsets = salt_offsets
+
+    state = {"control": generator.get_control(), "origin": generator.origin, "cs": generator.cs,
+             "zs_rand": generator.zs_rand, "cull_ocean": generator.cull_ocean,
+             "offsets": {"island": island_offsets, "salt": salt_offsets}}
+
+    with _shared_arrays() as shared, Pool(workers, initializer=_init_worker, initargs=(state,)) as pool:
+        data, normals = _render_stages(generator, pool, shared, _bands(generator.imgy, band_rows), tops)
+
+    print("Creating gradients...")
+    gradients = main.create_gradient_from_normals(normals, generator.instruments)
+    if generator.erosion_iterations > 0:
+        data, normals, gradients = erode(generator, data, gradients, workers, tile_size)
+    return data, normals, gradients
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Renders the island on several cores.")
+    parser.add_argument("--seed", type=int, default=None, help="seed of the island, random by default")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument("--band-rows", type=int, default=32, help="number of rows sent to a worker at once")
+    parser.add_argument("--tile-size", type=int, default=256, help="width and height of the tiles of the erosion")
+    parser.add_argument("--set", type=main.parse_control, action="append", default=[], metavar="NAME=VALUE",
+                        help="changes a value of the general control, like --set erosion_iterations=100")
+    args = parser.parse_args()
+
+    generator = main.IslandGenerator(args.seed, **dict(args.set))
+    data, normals, gradients = render(generator, args.workers, args.band_rows, args.tile_size)
+    main.draw(data)
+    main.draw_from_vectors(normals)
+    main.draw_from_vectors(gradients, filename="island_gradients.png")
@@ -0,0 +1,203 @@
+"""
+The island pipeline as a graph of stages, to only compute again what a change of the general control touches.
+
+Each stage declares the stages it takes as inputs and the values (of the general control, plus the seed) it reads.
+When the pipeline runs again, a stage is only executed if one of its values changed or one of its inputs was
+executed again. Changing weight_salt only mixes the salt again and makes the normals and gradients of the new
+heightmap, the warped noises and the julia data are kept from the previous run.
+
+The random values are drawn by small stages of their own (the draws are cheap, the noises aren't), so the stages
+using them only depend on the values that change what they get.
+
+Usage : python pipeline.py [--seed 42]
+"""
+
+import argparse
+import random
+import time
+
+import main
+import mipmap
+
+
+class Stage(object):
+    """
+    A step of the pipeline. function is called with the generator, a dict of the values it reads,
+    then the outputs of its inputs.
+    reusable, if given, is called with the dict of values and tells if the output can be kept for the next runs :
+    an output depending on something else than them (like the time a stage took) has to be computed again each run.
+    """
+    def __init__(self, name, function, inputs=(), values=(), reusable=None):
+        self.name = name
+        self.function = function
+        self.inputs = list(inputs)
+        self.values = list(values)
+        self.reusable = reusable
+
+
+def draw_randomness(generator, seed):
+    """
+    Draws every random value of an island like main.py does (see IslandGenerator.draw_randomness), with the general
+    control of generator but without touching its randomness.
+    """
+    drawer = main.IslandGenerator(seed, **generator.get_control())
+    island_offsets, (cs, zs_rand), salt_offsets = drawer.draw_randomness()
+    return {"origin": drawer.origin, "island_offsets": island_offsets, "cs": cs, "zs_rand": zs_rand,
+            "salt_offsets": salt_offsets}
+
+
+def _island_seed(generator, values):
+    drawn = draw_randomness(generator, values["seed"])
+    return drawn["origin"], drawn["island_offsets"]
+
+
+def _fractals(generator, values):
+    drawn = draw_randomness(generator, values["seed"])
+    return drawn["cs"], drawn["zs_rand"]
+
+
+def _salt_seed(generator, values):
+    # the salt offsets come after the fractals, so they also depend on how many there are
+    drawn = draw_randomness(generator, values["seed"])
+    return drawn["origin"], drawn["salt_offsets"]
+
+
+def _warp(generator, values, island_seed):
+    generator.origin, generator.simplex_offsets = island_seed
+    return generator.update_warp(freq=values["island_noise_frequency"], seed=False)
+
+
+def _scale(generator, values, warp, island_seed):
+    generator.origin, generator.simplex_offsets = island_seed
+    return main.scale_list(warp, 1.0, generator.top("warp", values["island_noise_frequency"]))
+
+
+def _julia(generator, values, scale, fractals):
+    generator.cs, generator.zs_rand = fractals
+    print("Creating the Julia set data...")
+    return generator.julia_rows(0, generator.imgy, scale)
+
+
+def _salt_noise(generator, values, salt_seed):
+    generator.origin, generator.simplex_offsets = salt_seed
+    return generator.update_warp(freq=values["salt_frequency"], seed=False)
+
+
+def _salt(generator, values, julia, salt_noise, salt_seed):
+    generator.origin, generator.simplex_offsets = salt_seed
+    salt_top = generator.top("warp", values["salt_frequency"])
+    return generator.mix_salt(main.scale_list(julia, 255.0, generator.top("julia")), salt_noise, salt_top)
+
+
+def _normals(generator, values, salt):
+    return main.create_normals(salt, instruments=generator.instruments)
+
+
+def _gradients(generator, values, normals):
+    return main.create_gradient_from_normals(normals, generator.instruments)
+
+
+def _erosion(generator, values, salt, normals, gradients):
+    if values["erosion_iterations"] <= 0:
+        return salt, normals, gradients
+    return generator.erode(salt, gradients)
+
+
+def _mipmaps(generator, values, erosion):
+    data, normals, gradients = erosion
+    return {"heights": mipmap.heights_pyramid(data), "normals": mipmap.normals_pyramid(normals)}
+
+
+def island_stages():
+    """
+    The stages of IslandGenerator.generate and the mip pyramids of the heightmap and normals (see mipmap.py),
+    in an order where each stage comes after its inputs.
+    The erosion stage gives the final heightmap, normals and gradients, the ones of salt, normals and gradients
+    when there's no erosion.
+    """
+    size = ["imgx", "imgy"]
+    falloff = size + ["radius_offset", "num_warpings"]
+    scaling = ["normalization", "noise_estimate_resolution"]
+    return [
+        Stage("island_seed", _island_seed, values=["seed", "num_warpings"]),
+        Stage("fractals", _fractals, values=["seed", "num_warpings", "num_frac", "constant_re_low", "constant_re_high",
+                                             "constant_im_low", "constant_im_high"]),
+        Stage("salt_seed", _salt_seed, values=["seed", "num_warpings", "num_frac"]),
+        Stage("warp", _warp, ["island_seed"], falloff + ["island_noise_frequency"]),
+        Stage("scale", _scale, ["warp", "island_seed"], scaling + falloff + ["island_noise_frequency"]),
+        Stage("julia", _julia, ["scale", "fractals"], size + ["noise_sharpness", "max_it", "adaptive_julia",
+                                                              "scale_value_low", "scale_value_high", "trans_max_value",
+                                                              "rotation_max_value"]),
+        Stage("salt_noise", _salt_noise, ["salt_seed"], falloff + ["salt_frequency"]),
+        Stage("salt", _salt, ["julia", "salt_noise", "salt_seed"],
+              scaling + falloff + ["salt_frequency", "max_it", "low_barrier", "weight_base", "weight_salt"]),
+        Stage("normals", _normals, ["salt"], size),
+        Stage("gradients", _gradients, ["normals"]),
+        Stage("erosion", _erosion, ["salt", "normals", "gradients"],
+              [name for name in main.control_names if name.startswith("erosion_")],
+              # with a time budget, the iterations done depend on the speed of the machine
+              reusable=lambda values: not values["erosion_seconds"]),
+        Stage("mipmaps", _mipmaps, ["erosion"]),
+    ]
+
+
+class Pipeline(object):
+    """
+    Runs the stages of an island, keeping their outputs between the runs.
+    The values of the general control can be changed by name, like for main.IslandGenerator.
+    A seed of None gets a random one, drawn once here so every stage draws its random values from the same seed.
+    """
+    def __init__(self, seed, stages=None, **control):
+        if seed is None:
+            seed = random.Random().randrange(2 ** 63)
+        self.seed = seed
+        self.generator = main.IslandGenerator(seed, **control)
+        self.stages = island_stages() if stages is None else stages
+        self.outputs = {}
+        self.used_values = {}
+        self.timings = {}
+
+    def __getitem__(self, name):
+        return self.outputs[name]
+
+    def run(self, seed=None, **changes):
+        """
+        Changes the seed and/or values of the general control (given by name), then executes the stages that need it.
+        Returns the names of the executed stages.
+        """
+        if seed is not None:
+            self.seed = seed
+        self.generator.set_control(changes)
+        current = self.generator.get_control()
+        current["seed"] = self.seed
+
+        executed = []
+        for stage in self.stages:
+            values = {name: current[name] for name in stage.values}
+            if (stage.name in self.outputs and self.used_values[stage.name] == values
+                    and (stage.reusable is None or stage.reusable(values))
+                    and not any(name in executed for name in stage.inputs)):
+                continue
+            start = time.perf_counter()
+            self.outputs[stage.name] = stage.function(self.generator, values, *[self.outputs[name] for name in stage.inputs])
+            self.timings[stage.name] = time.perf_counter() - start
+            self.used_values[stage.name] = values
+            executed.append(stage.name)
+        return executed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generates an island, then changes weight_salt and generates it again.")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the island")
+    parser.add_argument("--weight-salt", type=float, default=1.5, help="new value of weight_salt")
+    args = parser.parse_args()
+
+    pipeline = Pipeline(args.seed)
+    for changes in ({}, {"weight_salt": args.weight_salt}):
+        start = time.perf_counter()
+        executed = pipeline.run(**changes)
+        print("Executed {0} in {1:.2f}s.".format(", ".join(executed), time.perf_counter() - start))
+    data, normals, gradients = pipeline["erosion"]
+    main.draw(data)
+    main.draw_from_vectors(normals)
+    main.draw_from_vectors(gradients, filename="island_gradients.png")
@@ -0,0 +1,133 @@
+"""
+Progressive rendering of the island, for previews that show up long before the full image is done.
+
+The island is first rendered on a coarse grid of pixels (one every 16 by default), with fewer octaves of noise and
+a lower max_it, then again on finer and finer grids until the full image. Each level is a heightmap like the one of
+IslandGenerator.generate, but only holding the pixels of its grid.
+
+The grid of a level holds the grid of the level before it when its step divides the step before. When both levels
+use the same number of octaves, the warped noise already computed on the coarser grid is reused as is, and only the
+new pixels get computed. So after the first coarse level, the levels only add the julia data and the salting to the
+cost of a full render, the noise being computed once per pixel in all.
+
+With the default levels, the last level is the full image, and gives the exact same heightmap as
+IslandGenerator.generate for the same seed, before its erosion (the preview doesn't erode).
+With adaptive_julia, the julia data of each level is computed by julia_adaptive like generate does, so the last
+level still matches it.
+
+Usage : python preview.py [--seed 42] [--size 1024]
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+import main
+
+
+"""
+The default levels, as (step, octaves, max_it), max_it being the one of the generator when None.
+"""
+default_levels = [(16, 4, 12), (4, 8, None), (2, 8, None), (1, 8, None)]
+
+
+def _level_generator(generator, max_it):
+    """
+    A generator with the same randomness as generator, but another max_it.
+    """
+    level = main.IslandGenerator(**dict(generator.get_control(), max_it=max_it))
+    level.origin, level.cs, level.zs_rand = generator.origin, generator.cs, generator.zs_rand
+    level.julia_counters = generator.julia_counters
+    level.cull_ocean = generator.cull_ocean
+    return level
+
+
+def _level_warp(generator, x, y, freq, octaves, previous=None):
+    """
+    The transformed warped noise at the pixels (x, y) of a level, with the current simplex offsets of generator.
+    previous, if given, is the noise of a coarser level whose grid is x[::ratio, ::ratio], as (ratio, noise).
+    """
+    if previous is None:
+        # only the land gets noise, the ocean is 0 anyway (see IslandGenerator.warp_rows)
+        land = generator.land_grid(x, y)
+        warp = np.zeros(x.shape, dtype=np.float32)
+        x, y = x[land], y[land]
+        simplex = generator.warp_grid(x / generator.imgx, y / generator.imgy, freq, octaves)
+        warp[land] = generator.transform_warp_grid(x, y, simplex)
+        return warp
+
+    ratio, noise = previous
+    missing = np.ones(x.shape, dtype=bool)
+    missing[::ratio, ::ratio] = False
+    warp = np.empty(x.shape, dtype=np.float32)
+    warp[::ratio, ::ratio] = noise
+    warp[missing] = _level_warp(generator, x[missing], y[missing], freq, octaves)
+    return warp
+
+
+def progressive(generator, levels=None):
+    """
+    Renders the island of generator level by level (default_levels by default), coarsest first.
+    Yields (step, heightmap) for each level, the heightmap having a pixel every step pixels of the full image.
+    """
+    if levels is None:
+        levels = default_levels
+
+    island_offsets, _, salt_offsets = generator.draw_randomness()
+
+    generator.simplex_offsets = island_offsets
+    island_top = generator.top("warp", generator.island_noise_frequency)
+    generator.simplex_offsets = salt_offsets
+    salt_top = generator.top("warp", generator.salt_frequency)
+
+    previous = None
+    for step, octaves, max_it in levels:
+        level = _level_generator(generator, generator.max_it if max_it is None else max_it)
+        xs = np.arange(0, generator.imgx, step, dtype=np.float64)
+        ys = np.arange(0, generator.imgy, step, dtype=np.float64)
+        x, y = np.meshgrid(xs, ys)
+
+        reuse = {"island": None, "salt": None}
+        if previous is not None and previous["octaves"] == octaves and previous["step"] % step == 0:
+            ratio = previous["step"] // step
+            reuse = {name: (ratio, previous[name]) for name in reuse}
+
+        level.simplex_offsets = island_offsets
+        island = _level_warp(level, x, y, level.island_noise_frequency, octaves, reuse["island"])
+        level.simplex_offsets = salt_offsets
+        salt = _level_warp(level, x, y, level.salt_frequency, octaves, reuse["salt"])
+
+        # same coordinates as julia_rows, for the pixels of the level
+        zx = xs[np.newaxis, :] * 2 / (generator.imgx - 1) - 1
+        zy = ys[:, np.newaxis] * 2 / (generator.imgy - 1) - 1
+        data = main.scale_list(island, 1.0, island_top)
+        limits = level.warp_to_julia_grid(np.asarray(data, dtype=np.float64))
+        land = level.land_grid(x, y) if level.julia_skips_ocean() else None
+        if level.adaptive_julia:
+            data = level.julia_adaptive(zx, zy, level.cs, level.zs_rand, limits, level.adaptive_julia, land=land)
+        else:
+            data = level.julia_max(zx, zy, level.cs, level.zs_rand, limits, land=land)
+        data = main.scale_list(data, 255.0, level.top("julia"))
+        data = level.mix_salt(data, salt, salt_top)
+
+        previous = {"step": step, "octaves": octaves, "island": island, "salt": salt}
+        yield step, data
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Renders the island progressively, saving a preview for each level.")
+    parser.add_argument("--seed", type=int, default=None, help="seed of the island, random by default")
+    parser.add_argument("--size", type=int, default=None, help="width and height of the image (imgx and imgy)")
+    parser.add_argument("--set", type=main.parse_control, action="append", default=[], metavar="NAME=VALUE",
+                        help="changes a value of the general control, like --set max_it=32")
+    args = parser.parse_args()
+
+    control = dict(args.set)
+    if args.size is not None:
+        control["imgx"] = control["imgy"] = args.size
+
+    start = time.perf_counter()
+    for step, data in progressive(main.IslandGenerator(args.seed, **control)):
+        print("Level 1/{0} ready after {1:.2f}s.".format(step, time.perf_counter() - start))
+        main.draw(data, filename="preview_{0}.png".format(step))
@@ -0,0 +1,318 @@
+"""
+Generation server, to generate islands from another program without paying the startup of Python and of the
+imports for each one.
+
+The server keeps a pool of worker processes, that already imported everything, and answers on a local HTTP port :
+ - POST /generate with a JSON batch of islands, like
+       {"islands": [{"seed": 42, "size": 512}, {"seed": 43, "control": {"max_it": 32}}]}
+   size sets imgx and imgy, control changes any other value of the general control. A batch with a value of the
+   wrong type, or over its limit for the ones the work grows with (see work_limits), is refused with a 400.
+   The islands of a batch (and of concurrent batches) are generated in parallel by the workers.
+ - GET /status with the number of workers and of islands waiting or being generated.
+
+The answer of /generate is binary : a 4 bytes big-endian length, a JSON header of that length, then the arrays
+of each island (heightmap, normals and gradients) one after the other, as little-endian raw values.
+The header gives for each island its seed, the time it waited for a worker and the time it took to generate,
+and for each array its dtype, shape, offset and size in the data after the header. decode reads it back.
+
+When more than max_pending islands are waiting or being generated, new batches are refused with a 503 and a
+Retry-After header, instead of piling up in memory.
+A batch of more than max_pending islands on its own could never fit, so it's refused with a 413.
+
+Usage : python server.py serve [--port 8765] [--workers 8] [--max-pending 64]
+        python server.py client 1 2 3 [--size 256] [--url http://127.0.0.1:8765]
+"""
+
+import argparse
+import json
+import math
+import os
+import struct
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing import Pool
+
+import numpy as np
+
+import main
+
+
+output_names = ["heights", "normals", "gradients"]
+
+"""
+Lowest and highest values of the general control a client can ask for, on top of the size : the ones the work of an
+island grows with, so a single request can't keep the workers busy for hours.
+"""
+work_limits = {"max_it": (0, 256), "num_frac": (0, 64), "num_warpings": (0, 8), "noise_estimate_resolution": (1, 1024),
+               "erosion_iterations": (0, 1000), "erosion_seconds": (0.0, 60.0)}
+
+"""
+Values of the general control that are strings, and the ones they can take.
+"""
+choices = {"noise_backend": sorted(main.noise_backends), "normalization": ["image", "bounded"]}
+
+
+def _generate_island(task):
+    """
+    Generates an island in a worker. Returns its outputs and the time it waited in the queue and took to generate.
+    """
+    seed, control, submitted = task
+    start = time.time()
+    outputs = main.IslandGenerator(seed, **control).generate()
+    return outputs, start - submitted, time.time() - start
+
+
+def parse_control(name, value):
+    """
+    Checks a value of the general control from a request and gives it the type of its default, like
+    main.parse_control does for the command line. Raises ValueError if it can't be used, or if it's over its limit
+    in work_limits.
+    """
+    if name not in main.control_names:
+        raise ValueError("Unknown control value: {0}".format(name))
+    default = getattr(main, name)
+    if name in choices:
+        if value not in choices[name]:
+            raise ValueError("{0} must be one of {1}".format(name, ", ".join(choices[name])))
+        return value
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        raise ValueError("{0} must be a number".format(name))
+    if isinstance(default, int) and value != int(value):
+        raise ValueError("{0} must be an integer".format(name))
+    value = type(default)(value)
+    if name in work_limits and not work_limits[name][0] <= value <= work_limits[name][1]:
+        raise ValueError("{0} must be between {1} and {2}".format(name, *work_limits[name]))
+    return value
+
+
+def parse_batch(body, max_size=4096):
+    """
+    Reads a batch of islands from the JSON body of a request. Returns a list of (seed, control).
+    Raises ValueError if the batch isn't valid : a malformed body, a seed that isn't an integer (or null for a random
+    island), an unknown control value or one that can't be used (see parse_control), or a size out of 2 to max_size.
+    """
+    try:
+        islands = json.loads(body.decode("utf-8"))["islands"]
+    except (UnicodeDecodeError, ValueError, KeyError, TypeError):
+        raise ValueError('The body must be a JSON object like {"islands": [{"seed": 42, "size": 512}]}')
+    if not isinstance(islands, list) or not islands:
+        raise ValueError("islands must be a non-empty list")
+
+    batch = []
+    for island in islands:
+        if not isinstance(island, dict):
+            raise ValueError("Each island must be a JSON object")
+        seed = island.get("seed")
+        if seed is not None and (isinstance(seed, bool) or not isinstance(seed, int)):
+            raise ValueError("seed must be an integer, or null for a random island")
+        if not isinstance(island.get("control", {}), dict):
+            raise ValueError("control must be a JSON object")
+        control = dict(island.get("control", {}))
+        if "size" in island:
+            control["imgx"] = control["imgy"] = island["size"]
+        control = {name: parse_control(name, value) for name, value in control.items()}
+        for name in ("imgx", "imgy"):
+            if not 2 <= control.get(name, getattr(main, name)) <= max_size:
+                raise ValueError("{0} must be between 2 and {1}".format(name, max_size))
+        batch.append((seed, control))
+    return batch
+
+
+def encode(results):
+    """
+    Packs the results of a batch (a list of dicts with the seed, the timings and the outputs) into the binary format.
+    """
+    header = []
+    chunks = []
+    offset = 0
+    for result in results:
+        arrays = []
+        for name, array in zip(output_names, result.pop("outputs")):
+            array = np.ascontiguousarray(array, dtype=np.dtype(array.dtype).newbyteorder("<"))
+            arrays.append({"name": name, "dtype": array.dtype.str, "shape": list(array.shape),
+                           "offset": offset, "size": array.nbytes})
+            chunks.append(array.tobytes())
+            offset += array.nbytes
+        header.append(dict(result, arrays=arrays))
+    header = json.dumps({"islands": header}).encode("utf-8")
+    return b"".join([struct.pack(">I", len(header)), header] + chunks)
+
+
+def decode(body):
+    """
+    Reads an answer of /generate. Returns the header and a list with a dict of arrays ({name: array}) per island.
+    """
+    length = struct.unpack(">I", body[:4])[0]
+    header = json.loads(body[4:4 + length].decode("utf-8"))
+    data = memoryview(body)[4 + length:]
+    islands = []
+    for island in header["islands"]:
+        islands.append({array["name"]: np.frombuffer(data[array["offset"]:array["offset"] + array["size"]],
+                                                     dtype=array["dtype"]).reshape(array["shape"])
+                        for array in island["arrays"]})
+    return header, islands
+
+
+class GenerationServer(ThreadingHTTPServer):
+    """
+    The HTTP server, holding the pool of workers and the count of islands it's working on.
+    """
+    daemon_threads = True
+
+    def __init__(self, address, pool, workers, max_pending=64, max_size=4096):
+        ThreadingHTTPServer.__init__(self, address, _Handler)
+        self.pool = pool
+        self.workers = workers
+        self.max_pending = max_pending
+        self.max_size = max_size
+        self.pending = 0
+        self.lock = threading.Lock()
+
+    def reserve(self, count):
+        """
+        Counts count more pending islands if there's room for them. Returns whether there was.
+        """
+        with self.lock:
+            if self.pending + count > self.max_pending:
+                return False
+            self.pending += count
+            return True
+
+    def release(self, count):
+        with self.lock:
+            self.pending -= count
+
+    def generate(self, batch):
+        """
+        Generates a batch of islands on the workers. Returns the results of each island, in the order of the batch.
+        If an island fails, its error is raised once every island of the batch is done, so the batch never leaves
+        islands on the workers past its reservation.
+        """
+        start = time.time()
+        tasks = [self.pool.apply_async(_generate_island, ((seed, control, start),)) for seed, control in batch]
+        for task in tasks:
+            task.wait()
+        results = []
+        for (seed, control), task in zip(batch, tasks):
+            outputs, waited, seconds = task.get()
+            results.append({"seed": seed, "control": control, "queue_seconds": waited,
+                            "generate_seconds": seconds, "outputs": outputs})
+        return results
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def _answer(self, code, body, content_type="application/json", headers=()):
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, code, message, headers=()):
+        self._answer(code, json.dumps({"error": message}).encode("utf-8"), headers=headers)
+
+    def do_GET(self):
+        if self.path != "/status":
+            return self._error(404, "Unknown path: {0}".format(self.path))
+        status = {"workers": self.server.workers, "pending": self.server.pending,
+                  "max_pending": self.server.max_pending}
+        self._answer(200, json.dumps(status).encode("utf-8"))
+
+    def do_POST(self):
+        if self.path != "/generate":
+            return self._error(404, "Unknown path: {0}".format(self.path))
+        start = time.time()
+        try:
+            batch = parse_batch(self.rfile.read(int(self.headers.get("Content-Length", 0))), self.server.max_size)
+        except ValueError as error:
+            return self._error(400, str(error))
+
+        if len(batch) > self.server.max_pending:
+            return self._error(413, "Batch of {0} islands, more than the {1} the server takes at once: split it".format(
+                len(batch), self.server.max_pending))
+        if not self.server.reserve(len(batch)):
+            return self._error(503, "Too many islands pending, try again later", [("Retry-After", "1")])
+        try:
+            results = self.server.generate(batch)
+        except Exception as error:
+            return self._error(500, "{0}: {1}".format(type(error).__name__, error))
+        finally:
+            self.server.release(len(batch))
+
+        body = encode(results)
+        self._answer(200, body, "application/octet-stream",
+                     [("X-Batch-Seconds", "{0:.6f}".format(time.time() - start))])
+
+
+def serve(host="127.0.0.1", port=8765, workers=None, max_pending=64, max_size=4096):
+    """
+    Starts the pool of workers and answers requests until interrupted.
+    """
+    workers = workers or os.cpu_count()
+    with Pool(workers) as pool:
+        server = GenerationServer((host, port), pool, workers, max_pending, max_size)
+        print("Serving islands on http://{0}:{1} with {2} workers.".format(host, port, workers))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+
+
+def request_islands(islands, url="http://127.0.0.1:8765", retries=10):
+    """
+    The client side : asks the server for a batch of islands (a list of dicts with seed, size and control),
+    waiting and trying again while it's too busy. Returns the header and the arrays, like decode.
+    """
+    body = json.dumps({"islands": islands}).encode("utf-8")
+    for attempt in range(retries + 1):
+        request = urllib.request.Request(url + "/generate", data=body, headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(request) as answer:
+                return decode(answer.read())
+        except urllib.error.HTTPError as error:
+            if error.code != 503 or attempt == retries:
+                raise
+            time.sleep(float(error.headers.get("Retry-After", 1)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Server generating islands with a pool of warm workers.")
+    commands = parser.add_subparsers(dest="command")
+
+    server = commands.add_parser("serve", help="start the server")
+    server.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    server.add_argument("--port", type=int, default=8765, help="port to listen on")
+    server.add_argument("--workers", type=int, default=None, help="number of worker processes, one per core by default")
+    server.add_argument("--max-pending", type=int, default=64, help="number of islands pending before refusing more")
+    server.add_argument("--max-size", type=int, default=4096, help="biggest size of image allowed")
+
+    client = commands.add_parser("client", help="ask a running server for a batch of islands")
+    client.add_argument("seeds", type=int, nargs="+", help="seeds of the islands")
+    client.add_argument("--size", type=int, default=None, help="size of the islands")
+    client.add_argument("--set", type=main.parse_control, action="append", default=[], metavar="NAME=VALUE",
+                        help="changes a value of the general control, like --set max_it=32")
+    client.add_argument("--url", default="http://127.0.0.1:8765", help="address of the server")
+
+    args = parser.parse_args(sys.argv[1:] or ["serve"])
+    if args.command == "client":
+        islands = [{"seed": seed, "control": dict(args.set)} for seed in args.seeds]
+        if args.size is not None:
+            for island in islands:
+                island["size"] = args.size
+        start = time.perf_counter()
+        header, arrays = request_islands(islands, args.url)
+        for island, outputs in zip(header["islands"], arrays):
+            print("Island {0}: {1}x{2}, waited {3:.2f}s, generated in {4:.2f}s.".format(
+                island["seed"], outputs["heights"].shape[1], outputs["heights"].shape[0],
+                island["queue_seconds"], island["generate_seconds"]))
+        print("Batch of {0} islands in {1:.2f}s.".format(len(arrays), time.perf_counter() - start))
+    else:
+        serve(args.host, args.port, args.workers, args.max_pending, args.max_size)
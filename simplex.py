@@ -0,0 +1,108 @@
+"""
+2D simplex noise with fractal brownian motion (fBm), computed on whole arrays of positions with numpy.
+
+It's the snoise2 function of the noise library (https://github.com/caseman/noise, in noise-master.zip), written
+with numpy instead of C : the same permutation and gradient tables, the same skewing, the same octaves and base,
+and the same float32 operations in the same order, so it gives the very same values as snoise2, bit for bit.
+It only needs numpy, and computes every position of an array at once instead of one per call.
+
+Only the flat noise is there, not the tiled one of snoise2 (repeatx and repeaty).
+
+    values = fbm2(xs, ys, octaves=8, base=origin)  # same as snoise2(x, y, octaves=8, base=origin) for each (x, y)
+"""
+
+import numpy as np
+
+
+"""
+The permutation of the noise library, repeated twice so the lookups never wrap.
+"""
+PERM = np.array([
+    151, 160, 137, 91, 90, 15, 131, 13, 201, 95, 96, 53, 194, 233, 7, 225, 140, 36, 103, 30, 69, 142, 8, 99, 37,
+    240, 21, 10, 23, 190, 6, 148, 247, 120, 234, 75, 0, 26, 197, 62, 94, 252, 219, 203, 117, 35, 11, 32, 57,
+    177, 33, 88, 237, 149, 56, 87, 174, 20, 125, 136, 171, 168, 68, 175, 74, 165, 71, 134, 139, 48, 27, 166, 77,
+    146, 158, 231, 83, 111, 229, 122, 60, 211, 133, 230, 220, 105, 92, 41, 55, 46, 245, 40, 244, 102, 143, 54,
+    65, 25, 63, 161, 1, 216, 80, 73, 209, 76, 132, 187, 208, 89, 18, 169, 200, 196, 135, 130, 116, 188, 159, 86,
+    164, 100, 109, 198, 173, 186, 3, 64, 52, 217, 226, 250, 124, 123, 5, 202, 38, 147, 118, 126, 255, 82, 85,
+    212, 207, 206, 59, 227, 47, 16, 58, 17, 182, 189, 28, 42, 223, 183, 170, 213, 119, 248, 152, 2, 44, 154,
+    163, 70, 221, 153, 101, 155, 167, 43, 172, 9, 129, 22, 39, 253, 19, 98, 108, 110, 79, 113, 224, 232, 178,
+    185, 112, 104, 218, 246, 97, 228, 251, 34, 242, 193, 238, 210, 144, 12, 191, 179, 162, 241, 81, 51, 145,
+    235, 249, 14, 239, 107, 49, 192, 214, 31, 181, 199, 106, 157, 184, 84, 204, 176, 115, 121, 50, 45, 127, 4,
+    150, 254, 138, 236, 205, 93, 222, 114, 67, 29, 24, 72, 243, 141, 128, 195, 78, 66, 215, 61, 156, 180
+] * 2, dtype=np.int64)
+
+"""
+The x and y of the 12 gradients of the noise library (its GRAD3 table, whose z is only used by the 3D noise).
+"""
+GRAD_X = np.array([1, -1, 1, -1, 1, -1, 1, -1, 0, 0, 0, 0], dtype=np.float32)
+GRAD_Y = np.array([1, 1, -1, -1, 0, 0, 0, 0, 1, -1, 1, -1], dtype=np.float32)
+
+F2 = np.float32(0.3660254037844386)  # 0.5 * (sqrt(3.0) - 1.0)
+G2 = np.float32(0.21132486540518713)  # (3.0 - sqrt(3.0)) / 6.0
+
+
+def noise2(x, y):
+    """
+    A single octave of simplex noise at the positions (x, y), float32 arrays of the same shape.
+    """
+    one, half = np.float32(1.0), np.float32(0.5)
+    s = (x + y) * F2
+    i = np.floor(x + s)
+    j = np.floor(y + s)
+    t = (i + j) * G2
+
+    # the 3 corners of the simplex the position is in, relative to the position
+    x0 = x - (i - t)
+    y0 = y - (j - t)
+    i1 = x0 > y0
+    j1 = ~i1
+    x1 = x0 - i1.astype(np.float32) + G2
+    y1 = y0 - j1.astype(np.float32) + G2
+    x2 = x0 + G2 * np.float32(2.0) - one
+    y2 = y0 + G2 * np.float32(2.0) - one
+
+    big_i = i.astype(np.int64) & 255
+    big_j = j.astype(np.int64) & 255
+    gradients = [PERM[big_i + PERM[big_j]] % 12,
+                 PERM[big_i + i1 + PERM[big_j + j1]] % 12,
+                 PERM[big_i + 1 + PERM[big_j + 1]] % 12]
+
+    total = None
+    for xc, yc, g in zip((x0, x1, x2), (y0, y1, y2), gradients):
+        f = half - xc * xc - yc * yc
+        corner = np.where(f > 0, f * f * f * f * (GRAD_X[g] * xc + GRAD_Y[g] * yc), np.float32(0.0))
+        total = corner if total is None else total + corner
+    return total * np.float32(70.0)
+
+
+def fbm2(xs, ys, octaves=1, persistence=0.5, lacunarity=2.0, base=0.0, block_size=65536):
+    """
+    Same as snoise2(x, y, octaves, persistence, lacunarity, base=base) of the noise library for each (x, y) of the
+    arrays xs and ys, as a float64 array of their shape.
+    The arrays are computed by blocks of block_size positions, so the temporary arrays stay in the cache.
+    """
+    if octaves <= 0:
+        raise ValueError("Expected octaves value > 0")
+    xs, ys = np.broadcast_arrays(np.asarray(xs, dtype=np.float64), np.asarray(ys, dtype=np.float64))
+    shape = xs.shape
+    # snoise2 takes its arguments as C floats
+    xs = xs.astype(np.float32).ravel()
+    ys = ys.astype(np.float32).ravel()
+    z = np.float32(base)
+    persistence, lacunarity = np.float32(persistence), np.float32(lacunarity)
+
+    values = np.empty(xs.size, dtype=np.float64)
+    for start in range(0, xs.size, block_size):
+        x = xs[start:start + block_size]
+        y = ys[start:start + block_size]
+        freq = np.float32(1.0)
+        amp = np.float32(1.0)
+        top = np.float32(1.0)
+        total = noise2(x + z, y + z)
+        for octave in range(1, int(octaves)):
+            freq *= lacunarity
+            amp *= persistence
+            top += amp
+            total += noise2(x * freq + z, y * freq + z) * amp
+        values[start:start + block_size] = total / top
+    return values.reshape(shape)
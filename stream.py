@@ -0,0 +1,197 @@
+"""
+Streaming generation of huge islands, with a memory use that doesn't depend on the height of the image.
+
+The image goes through the pipeline band of rows by band of rows, and each band of the heightmap, normals and
+gradients is written to its .npy file as soon as it's done. Only a band (plus a few rows) of each stage is ever
+in memory, so a 16384x16384 island only needs O(band_rows * width) of memory.
+
+In "bounded" normalization (see IslandGenerator.top), the scalings are known before generating anything, so each
+band goes through the whole pipeline at once.
+In "image" normalization, they need the max of the whole warp, salt and julia data, which isn't known before every
+band went through them. So the warps and the julia data are written to temporary files on the disk as they come,
+with their max, and read back band by band once it's known :
+ - first pass : the warped noise of the island and of the salt,
+ - second pass : the julia data, from the scaled warp,
+ - third pass : the salted heightmap, its normals (with a halo of a row on each side) and its gradients.
+Either way, this gives the exact same output as IslandGenerator.generate for the same seed.
+The erosion can't be streamed, since each of its iterations goes through the whole heightmap : use parallel.py,
+which erodes the island tile by tile.
+
+The outputs can be opened without loading them with numpy.load(filename, mmap_mode="r"), and given as is to
+the functions of export.py.
+
+Usage : python stream.py [--seed 42] [--size 16384] [--band-rows 128] [--name images/island]
+"""
+
+import argparse
+import os
+import tempfile
+
+import numpy as np
+
+import main
+
+
+class _Spill(object):
+    """
+    A temporary file holding an image of shape (height, width), written band by band and read back band by band.
+    Keeps the max of what's written in it.
+    """
+    def __init__(self, directory, name, width, dtype):
+        self.file = open(os.path.join(directory, name), "w+b")
+        self.width = width
+        self.dtype = np.dtype(dtype)
+        self.top = None
+
+    def write(self, band):
+        band = np.ascontiguousarray(band, dtype=self.dtype)
+        top = band.max()
+        self.top = top if self.top is None else max(self.top, top)
+        self.file.write(band.tobytes())
+
+    def read(self, y_start, y_end):
+        self.file.seek(y_start * self.width * self.dtype.itemsize)
+        return np.fromfile(self.file, dtype=self.dtype, count=(y_end - y_start) * self.width).reshape(-1, self.width)
+
+    def close(self):
+        self.file.close()
+
+
+class _NpyWriter(object):
+    """
+    Writes an array of a known shape to a .npy file, band of rows by band of rows.
+    """
+    def __init__(self, filename, shape, dtype):
+        self.file = open(filename, "wb")
+        self.dtype = np.dtype(dtype).newbyteorder("<")
+        np.lib.format.write_array_header_1_0(self.file, {"descr": np.lib.format.dtype_to_descr(self.dtype),
+                                                         "fortran_order": False, "shape": tuple(shape)})
+
+    def write(self, band):
+        self.file.write(np.ascontiguousarray(band, dtype=self.dtype).tobytes())
+
+    def close(self):
+        self.file.close()
+
+
+def _bands(height, band_rows):
+    return [(y, min(y + band_rows, height)) for y in range(0, height, band_rows)]
+
+
+def _bounded_heights(generator, bands, island_offsets, salt_offsets):
+    """
+    The bands of the heightmap in "bounded" normalization, each one going through all the stages at once.
+    """
+    generator.simplex_offsets = island_offsets
+    island_top = generator.top("warp", generator.island_noise_frequency)
+    generator.simplex_offsets = salt_offsets
+    salt_top = generator.top("warp", generator.salt_frequency)
+    julia_top = generator.top("julia")
+
+    print("Creating the island band by band...")
+    for y_start, y_end in bands:
+        generator.simplex_offsets = island_offsets
+        data = main.scale_list(generator.warp_rows(y_start, y_end, freq=generator.island_noise_frequency), 1.0,
+                               island_top)
+        data = main.scale_list(generator.julia_rows(y_start, y_end, data), 255.0, julia_top)
+        generator.simplex_offsets = salt_offsets
+        # the salt is only kept over low_barrier, and its scaling doesn't need the rest of it
+        salt = generator.warp_rows(y_start, y_end, freq=generator.salt_frequency, mask=data > generator.low_barrier)
+        yield generator.mix_salt(data, salt, salt_top)
+
+
+def _spilled_heights(generator, bands, island_offsets, salt_offsets):
+    """
+    The bands of the heightmap in "image" normalization, the warps and julia data going through temporary files.
+    """
+    width = generator.imgx
+    with tempfile.TemporaryDirectory() as spill_dir:
+        warp = _Spill(spill_dir, "warp", width, np.float32)
+        salt = _Spill(spill_dir, "salt", width, np.float32)
+        julia = _Spill(spill_dir, "julia", width, np.int32)
+        try:
+            print("Creating some warped noise...")
+            for y_start, y_end in bands:
+                generator.simplex_offsets = island_offsets
+                warp.write(generator.warp_rows(y_start, y_end, freq=generator.island_noise_frequency))
+                generator.simplex_offsets = salt_offsets
+                salt.write(generator.warp_rows(y_start, y_end, freq=generator.salt_frequency))
+
+            print("Creating the Julia set data...")
+            for y_start, y_end in bands:
+                data = main.scale_list(warp.read(y_start, y_end), 1.0, top=warp.top)
+                julia.write(generator.julia_rows(y_start, y_end, data))
+
+            for y_start, y_end in bands:
+                data = main.scale_list(julia.read(y_start, y_end), 255.0, top=julia.top)
+                yield generator.mix_salt(data, salt.read(y_start, y_end), salt_top=salt.top)
+        finally:
+            for spill in (warp, salt, julia):
+                spill.close()
+
+
+def stream(generator, name="images/island", band_rows=128):
+    """
+    Generates an island with generator, band by band, and writes its heightmap, normals and gradients to
+    name + "_heights.npy", name + "_normals.npy" and name + "_gradients.npy".
+    Returns the names of the three files.
+    """
+    if generator.erosion_iterations > 0:
+        raise ValueError("The erosion needs the whole heightmap, it can't be streamed")
+    height, width = generator.imgy, generator.imgx
+    bands = _bands(height, band_rows)
+
+    island_offsets, _, salt_offsets = generator.draw_randomness()
+
+    if generator.top("julia") is None:
+        heights = _spilled_heights(generator, bands, island_offsets, salt_offsets)
+    else:
+        heights = _bounded_heights(generator, bands, island_offsets, salt_offsets)
+
+    filenames = [name + "_heights.npy", name + "_normals.npy", name + "_gradients.npy"]
+    outputs = [_NpyWriter(filenames[0], (height, width), np.float64),
+               _NpyWriter(filenames[1], (height, width, 3), np.float32),
+               _NpyWriter(filenames[2], (height, width, 3), np.float32)]
+    try:
+        # The normals of a row need the rows around it, so they're one row behind the heightmap.
+        # window holds the rows of the heightmap from window_start to the last one made.
+        window = np.empty((0, width))
+        window_start = 0
+        done = 0
+        for (y_start, y_end), data in zip(bands, heights):
+            outputs[0].write(data)
+
+            window = np.concatenate([window, data])
+            end = y_end if y_end == height else y_end - 1
+            if end > done:
+                normals = main.create_normals(window, done - window_start, end - window_start,
+                                              instruments=generator.instruments)
+                outputs[1].write(normals)
+                outputs[2].write(main.create_gradient_from_normals(normals, generator.instruments))
+                done = end
+
+            window = window[max(done - 1, 0) - window_start:]
+            window_start = max(done - 1, 0)
+    finally:
+        heights.close()
+        for output in outputs:
+            output.close()
+
+    print("Saved heightmap, normals and gradients as {0}.".format(", ".join(filenames)))
+    return filenames
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generates an island band by band, with a bounded memory use.")
+    parser.add_argument("--seed", type=int, default=None, help="seed of the island, random by default")
+    parser.add_argument("--size", type=int, default=None, help="width and height of the image (imgx and imgy)")
+    parser.add_argument("--set", type=main.parse_control, action="append", default=[], metavar="NAME=VALUE",
+                        help="changes a value of the general control, like --set max_it=32")
+    parser.add_argument("--band-rows", type=int, default=128, help="number of rows of a band")
+    parser.add_argument("--name", default="images/island", help="path of the files, without the suffixes")
+    args = parser.parse_args()
+
+    control = dict(args.set)
+    if args.size is not None:
+        control["imgx"] = control["imgy"] = args.size
+    stream(main.IslandGenerator(args.seed, **control), args.name, args.band_rows)
@@ -0,0 +1,53 @@
+"""
+The command line of batch.py : negative seeds and running a batch again with more formats.
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+import batch
+
+
+script = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "batch.py")
+
+
+def _run(output, *args):
+    command = [sys.executable, script, "--grid", "imgx=16", "--grid", "imgy=16", "--output", str(output),
+               "--workers", "1"] + list(args)
+    return subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+
+
+def _seeds(output):
+    return sorted(json.load(open(os.path.join(output, name)))["seed"]
+                  for name in os.listdir(output) if name.endswith(".json"))
+
+
+def test_parse_seeds():
+    assert batch.parse_seeds(["-5", "-10--8", "-2-1", "3,5"]) == [-5, -10, -9, -8, -2, -1, 0, 1, 3, 5]
+
+
+def test_negative_seeds(tmp_path):
+    result = _run(tmp_path, "--seeds=-10--8", "--formats", "npy")
+    assert result.returncode == 0, result.stdout
+    assert _seeds(tmp_path) == [-10, -9, -8]
+
+    result = _run(tmp_path, "--seeds", "-5", "--formats", "npy")
+    assert result.returncode == 0, result.stdout
+    assert _seeds(tmp_path) == [-10, -9, -8, -5]
+
+
+def test_missing_formats(tmp_path):
+    assert _run(tmp_path, "--seeds", "1", "2", "--formats", "png").returncode == 0
+    result = _run(tmp_path, "--seeds", "1", "2", "--formats", "png", "npy")
+    assert result.returncode == 0, result.stdout
+    assert "2 islands to make, 0 already done." in result.stdout
+    npy = [name for name in os.listdir(tmp_path) if name.endswith(".npy")]
+    assert len(npy) == 2
+    for name in os.listdir(tmp_path):
+        if name.endswith(".json"):
+            assert json.load(open(os.path.join(tmp_path, name)))["files"] == ["png", "npy"]
+
+    result = _run(tmp_path, "--seeds", "1", "2", "--formats", "npy")
+    assert "0 islands to make, 2 already done." in result.stdout
@@ -0,0 +1,56 @@
+"""
+Culling the ocean (IslandGenerator.cull_ocean) has to give the same island as computing every pixel.
+"""
+
+import contextlib
+import io
+
+import numpy as np
+import pytest
+
+import main
+import parallel
+import preview
+
+
+size = 64
+
+
+def _generator(noise_sharpness, cull_ocean):
+    generator = main.IslandGenerator(3, imgx=size, imgy=size, noise_sharpness=noise_sharpness)
+    generator.cull_ocean = cull_ocean
+    return generator
+
+
+def _assert_same(outputs):
+    culled, computed = outputs[True], outputs[False]
+    for a, b in zip(culled, computed):
+        np.testing.assert_array_equal(a, b)
+
+
+@pytest.mark.parametrize("noise_sharpness", [0.0, main.noise_sharpness])
+def test_generate(noise_sharpness):
+    outputs = {}
+    for cull_ocean in (True, False):
+        with contextlib.redirect_stdout(io.StringIO()):
+            outputs[cull_ocean] = _generator(noise_sharpness, cull_ocean).generate()
+    _assert_same(outputs)
+
+
+@pytest.mark.parametrize("noise_sharpness", [0.0, main.noise_sharpness])
+def test_parallel(noise_sharpness):
+    outputs = {}
+    for cull_ocean in (True, False):
+        with contextlib.redirect_stdout(io.StringIO()):
+            outputs[cull_ocean] = parallel.render(_generator(noise_sharpness, cull_ocean), workers=2, band_rows=16)
+    _assert_same(outputs)
+    with contextlib.redirect_stdout(io.StringIO()):
+        _assert_same({True: outputs[False], False: _generator(noise_sharpness, False).generate()})
+
+
+@pytest.mark.parametrize("noise_sharpness", [0.0, main.noise_sharpness])
+def test_preview(noise_sharpness):
+    outputs = {}
+    for cull_ocean in (True, False):
+        outputs[cull_ocean] = [data for step, data in preview.progressive(_generator(noise_sharpness, cull_ocean))]
+    _assert_same(outputs)
@@ -20,6 +20,8 @@ THE SOFTWARE.
 
 import math
 
+import numpy as np
+
 
 class Vector(object):
     def __init__(self, *args):
@@ -152,4 +154,171 @@ class Vector(object):
         return self.values[key]
 
     def __repr__(self):
-        return str(self.values)
\ No newline at end of file
+        return str(self.values)
+
+
+class Vector2(object):
+    """ A 2D vector with its components in slots, for the scalar code paths.
+        Same operations as Vector, written out for two components without building any tuple:
+        v = Vector2(1, 2); w = v * 4.0 + Vector2(0.5, 0.5)
+        Its components can change, so it's compared by value but can't be hashed (no dict keys or sets).
+    """
+    __slots__ = ("x", "y")
+    __hash__ = None
+
+    def __init__(self, x=0, y=0):
+        self.x = x
+        self.y = y
+
+    def norm(self):
+        """ Returns the norm (length, magnitude) of the vector """
+        return math.sqrt(self.x * self.x + self.y * self.y)
+
+    def normalize(self):
+        """ Returns a normalized unit vector """
+        norm = self.norm()
+        return Vector2(self.x / norm, self.y / norm)
+
+    def inner(self, other):
+        """ Returns the dot product (inner product) of self and other vector """
+        return self.x * other.x + self.y * other.y
+
+    def __mul__(self, other):
+        """ Returns the dot product with another Vector2, or the vector scaled by a number """
+        if type(other) == Vector2:
+            return self.x * other.x + self.y * other.y
+        return Vector2(self.x * other, self.y * other)
+
+    def __rmul__(self, other):
+        return Vector2(self.x * other, self.y * other)
+
+    def __truediv__(self, other):
+        return Vector2(self.x / other, self.y / other)
+
+    def __add__(self, other):
+        return Vector2(self.x + other.x, self.y + other.y)
+
+    def __sub__(self, other):
+        return Vector2(self.x - other.x, self.y - other.y)
+
+    def __neg__(self):
+        return Vector2(-self.x, -self.y)
+
+    def __eq__(self, other):
+        return type(other) == Vector2 and self.x == other.x and self.y == other.y
+
+    def __iter__(self):
+        yield self.x
+        yield self.y
+
+    def __len__(self):
+        return 2
+
+    def __getitem__(self, key):
+        return (self.x, self.y)[key]
+
+    def __repr__(self):
+        return str((self.x, self.y))
+
+
+class VectorField(object):
+    """ A whole field of vectors (like the normals of a heightmap), stored as a struct of arrays :
+        one array per component instead of the components of each vector next to each other.
+        The operations work on whole components at once, with numpy. A component can also be a single number,
+        shared by every vector of the field.
+
+        VectorField.empty and VectorField.from_array put the components in a single contiguous buffer of shape
+        (components, ...), and to_array writes them back to the usual (..., components) layout.
+    """
+    __slots__ = ("components",)
+
+    def __init__(self, *components):
+        self.components = list(components)
+
+    @classmethod
+    def empty(cls, shape, size=3, dtype=np.float64):
+        """ A field of the given shape, in a new buffer of shape (size,) + shape """
+        return cls(*np.empty((size,) + tuple(shape), dtype=dtype))
+
+    @classmethod
+    def from_array(cls, array, dtype=np.float64):
+        """ The field of an array of vectors of shape (..., size), copied to a contiguous buffer """
+        array = np.asarray(array)
+        buffer = np.empty((array.shape[-1],) + array.shape[:-1], dtype=dtype)
+        for i in range(array.shape[-1]):
+            buffer[i] = array[..., i]
+        return cls(*buffer)
+
+    def to_array(self, out=None, dtype=np.float32):
+        """ The field as an array of vectors of shape (..., size), written to out if given """
+        if out is None:
+            shape = np.broadcast(*self.components).shape
+            out = np.empty(shape + (len(self.components),), dtype=dtype)
+        for i, component in enumerate(self.components):
+            out[..., i] = component
+        return out
+
+    @property
+    def x(self):
+        return self.components[0]
+
+    @property
+    def y(self):
+        return self.components[1]
+
+    @property
+    def z(self):
+        return self.components[2]
+
+    def norm(self):
+        """ Returns the norm of each vector """
+        return np.sqrt(sum(c * c for c in self.components))
+
+    def normalize(self):
+        """ Returns the field of the normalized vectors """
+        norm = self.norm()
+        return VectorField(*(c / norm for c in self.components))
+
+    def inner(self, other):
+        """ Returns the dot product of each vector with the one of the other field """
+        return sum(a * b for a, b in zip(self.components, other.components))
+
+    def cross(self, other):
+        (ax, ay, az), (bx, by, bz) = self.components, other.components
+        return VectorField(ay * bz - az * by, az * bx - ax * bz, ax * by - ay * bx)
+
+    def __mul__(self, other):
+        """ Returns the dot products with another field, or the field scaled by a number or an array """
+        if isinstance(other, VectorField):
+            return self.inner(other)
+        return VectorField(*(c * other for c in self.components))
+
+    def __rmul__(self, other):
+        return VectorField(*(other * c for c in self.components))
+
+    def __truediv__(self, other):
+        return VectorField(*(c / other for c in self.components))
+
+    def __add__(self, other):
+        return VectorField(*(a + b for a, b in zip(self.components, other.components)))
+
+    def __sub__(self, other):
+        return VectorField(*(a - b for a, b in zip(self.components, other.components)))
+
+    def __iadd__(self, other):
+        """ Adds the other field in place, for the components that are arrays """
+        for i, (a, b) in enumerate(zip(self.components, other.components)):
+            if isinstance(a, np.ndarray):
+                a += b
+            else:
+                self.components[i] = a + b
+        return self
+
+    def __len__(self):
+        return len(self.components)
+
+    def __getitem__(self, key):
+        return self.components[key]
+
+    def __repr__(self):
+        return "VectorField({0})".format(", ".join(repr(c) for c in self.components))
@@ -0,0 +1,121 @@
+"""
+Infinite world made of islands, generated chunk by chunk.
+
+The world is a grid of island cells of island_size x island_size pixels, each one laid out like the image of main.py :
+the island is centered in its cell and fades to the ocean on its border.
+Every value of a chunk only depends on the world seed and on the world coordinates of its pixels, so chunks can be made
+in any order, without their neighbours, and still line up exactly with them.
+
+ - The warped noise of the island and of the salt is a single noise over the whole world, seeded by the world seed.
+ - Each cell gets its own fractals, seeded by the world seed and the position of the cell.
+ - A chunk can't know the max of the whole world, so the scalings use fixed ranges instead :
+   the noise is used as is since it's already between -1 and 1, and the julia data is scaled by max_it.
+
+Usage : python world.py --seed 42 [--size 256] [--chunks 0 0 4 4]
+"""
+
+import argparse
+
+import numpy as np
+from PIL import Image
+
+import main
+
+
+def world_noise(world_seed, **control):
+    """
+    Returns the generator of a world, with its origin, and the simplex offsets of the island noise and of the salt noise.
+    They're drawn like the ones of a single island (see IslandGenerator.draw_randomness), the fractals of the world
+    seed being left for cell_fractals to replace.
+    """
+    generator = main.IslandGenerator(world_seed, **control)
+    island_offsets, _, salt_offsets = generator.draw_randomness()
+    return generator, island_offsets, salt_offsets
+
+
+def cell_fractals(generator, world_seed, cell_x, cell_y):
+    """
+    Returns the constants and Z-seeds of the fractals of the island in the cell (cell_x, cell_y).
+    """
+    generator.random.seed("{0}:{1}:{2}".format(world_seed, cell_x, cell_y))
+    generator.seed_julia()
+    return generator.cs, generator.zs_rand
+
+
+def world_warp(generator, x, y, freq):
+    """
+    The transformed warped noise at the world positions (x, y), with the current offsets of the generator,
+    whose image size is the size of an island cell.
+    """
+    island_size = generator.imgx
+    local_x = x - np.floor_divide(x, island_size) * island_size
+    local_y = y - np.floor_divide(y, island_size) * island_size
+    # only the land of the cells gets noise, the ocean is 0 anyway (see IslandGenerator.warp_rows)
+    land = generator.land_grid(local_x, local_y)
+    warp = np.zeros(np.shape(x), dtype=np.float32)
+    simplex = generator.warp_grid(x[land] / island_size, y[land] / island_size, freq=freq)
+    warp[land] = generator.transform_warp_grid(local_x[land], local_y[land], simplex)
+    return warp
+
+
+def generate_chunk(world_seed, cx, cy, size=256, island_size=None, **control):
+    """
+    Generates the heightmap of the chunk (cx, cy) of the world, which covers the world pixels
+    cx * size to (cx + 1) * size (excluded) horizontally and the same with cy vertically.
+    island_size is the size of an island cell, imgx by default.
+    The other values of the general control can be changed by name, like for main.IslandGenerator.
+
+    Returns an array of shape (size, size) with heights between 0 and 255, like add_salt does.
+    """
+    if island_size is None:
+        island_size = control.get("imgx", main.imgx)
+    control.update(imgx=island_size, imgy=island_size)
+    generator, island_offsets, salt_offsets = world_noise(world_seed, **control)
+
+    x = np.arange(cx * size, (cx + 1) * size, dtype=np.float64)
+    y = np.arange(cy * size, (cy + 1) * size, dtype=np.float64)
+    x, y = np.meshgrid(x, y)
+    cells_x = np.floor_divide(x, island_size).astype(np.int64)
+    cells_y = np.floor_divide(y, island_size).astype(np.int64)
+
+    generator.simplex_offsets = island_offsets
+    data = world_warp(generator, x, y, generator.island_noise_frequency)
+    limits = generator.warp_to_julia_grid(np.asarray(main.scale_list(data, 1.0, top=1.0), dtype=np.float64))
+
+    # same coordinates as julia_rows, relative to the cell
+    zx = (x - cells_x * island_size) * 2 / (island_size - 1) - 1
+    zy = (y - cells_y * island_size) * 2 / (island_size - 1) - 1
+    color = np.zeros(x.shape, dtype=np.int32)
+    for cell_x, cell_y in set(zip(cells_x.ravel().tolist(), cells_y.ravel().tolist())):
+        cs, zs_rand = cell_fractals(generator, world_seed, cell_x, cell_y)
+        cell = (cells_x == cell_x) & (cells_y == cell_y)
+        land = None
+        if generator.julia_skips_ocean():
+            land = generator.land_grid(x[cell] - cell_x * island_size, y[cell] - cell_y * island_size)
+        color[cell] = generator.julia_max(zx[cell], zy[cell], cs, zs_rand, limits[cell], land=land)
+    data = main.scale_list(color, 255.0, top=max(generator.max_it - 1, 1))
+
+    generator.simplex_offsets = salt_offsets
+    salt = world_warp(generator, x, y, generator.salt_frequency)
+    return generator.mix_salt(data, salt, salt_top=1.0)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generates a part of an infinite world of islands.")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the world")
+    parser.add_argument("--size", type=int, default=256, help="size of a chunk in pixels")
+    parser.add_argument("--island-size", type=int, default=main.imgx, help="size of an island cell in pixels")
+    parser.add_argument("--chunks", type=int, nargs=4, default=[0, 0, 4, 4], metavar=("X0", "Y0", "X1", "Y1"),
+                        help="chunks to generate, from (X0, Y0) to (X1, Y1) excluded")
+    parser.add_argument("--output", default="images/world.png", help="where to save the chunks, side by side")
+    args = parser.parse_args()
+
+    x0, y0, x1, y1 = args.chunks
+    world = np.zeros(((y1 - y0) * args.size, (x1 - x0) * args.size))
+    for cy in range(y0, y1):
+        for cx in range(x0, x1):
+            print("Creating chunk ({0}, {1})...".format(cx, cy))
+            chunk = generate_chunk(args.seed, cx, cy, args.size, args.island_size)
+            world[(cy - y0) * args.size:(cy - y0 + 1) * args.size, (cx - x0) * args.size:(cx - x0 + 1) * args.size] = chunk
+    Image.fromarray(np.clip(world, 0, 255).astype(np.uint8)).save(args.output, "PNG")
+    print("Saved world as {0}.".format(args.output))